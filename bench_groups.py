@@ -0,0 +1,130 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy
+
+from groups import *
+
+# Each family climbs a ladder of sizes, small enough at the top for every task to finish
+LADDER = {
+    'Z': [lambda: Z(16), lambda: Z(128), lambda: Z(1024)],
+    'U': [lambda: U(32), lambda: U(256), lambda: U(2048)],
+    'S': [lambda: S(4), lambda: S(5), lambda: S(6)],
+    'A': [lambda: A(4), lambda: A(5), lambda: A(6)],
+    'D': [lambda: D(8), lambda: D(64), lambda: D(256)],
+    'Dic': [lambda: Dic(4), lambda: Dic(32), lambda: Dic(128)],
+    'Aff': [lambda: Aff(Z(3), getop('matrixmod', 3)), lambda: Aff(Z(7), getop('matrixmod', 7)), lambda: Aff(Z(13), getop('matrixmod', 13))],
+    'GL': [lambda: GL(2, Z(2), getop('matrixmod', 2)), lambda: GL(2, Z(3), getop('matrixmod', 3)), lambda: GL(2, Z(5), getop('matrixmod', 5))],
+    'SL': [lambda: SL(2, Z(3), getop('matrixmod', 3)), lambda: SL(2, Z(5), getop('matrixmod', 5)), lambda: SL(2, Z(7), getop('matrixmod', 7))],
+    'M': [lambda: M(2, Z(2), getop('matrixmod', 2)), lambda: M(2, Z(3), getop('matrixmod', 3)), lambda: M(2, Z(4), getop('matrixmod', 4))],
+    'PermutationGeneratorGroup': [lambda: PermutationGeneratorGroup([[[1,2,3,4]],[[1,2]]]),
+                                  lambda: PermutationGeneratorGroup([[[1,2,3,4,5]],[[1,2]]]),
+                                  lambda: PermutationGeneratorGroup([[[1,2,3,4,5,6]],[[1,2]]])],
+    'MatrixGeneratorGroup': [lambda: MatrixGeneratorGroup([[[1,1],[0,1]],[[0,2],[1,0]]], getop('matrixmod', 3)),
+                             lambda: MatrixGeneratorGroup([[[1,1],[0,1]],[[0,4],[1,0]]], getop('matrixmod', 5)),
+                             lambda: MatrixGeneratorGroup([[[1,1],[0,1]],[[0,6],[1,0]]], getop('matrixmod', 7))],
+}
+
+def small_subgroup(g):
+    # A cyclic subgroup to take cosets and centralizers of
+    return GeneratorGroup(g.l[len(g.l)//2], g.op)
+
+TASKS = {
+    'cyclic': lambda g: g.cyclic(),
+    'orders': lambda g: g.orders(),
+    'abelian': lambda g: g.abelian(),
+    'center': lambda g: g.center(),
+    'centralizer': lambda g: g.centralizer(small_subgroup(g)),
+    'lcosets': lambda g: g.lcosets(small_subgroup(g)),
+    'rcosets': lambda g: g.rcosets(small_subgroup(g)),
+    'cayley': lambda g: g.cayley(),
+    'subgroups': lambda g: [g.subgroups(k) for k in range(1, len(g)+1) if len(g)%k == 0],
+}
+
+def best(f, repeat):
+    # Best of repeat runs, each on whatever f sets up fresh
+    times = []
+    for _ in range(repeat):
+        times.append(f())
+    return min(times)
+
+def run(families, levels, tasks, repeat, table=False, out=sys.stdout):
+    results = {}
+    for family in families:
+        for level, make in enumerate(LADDER[family][:levels]):
+            g = make()
+            name = family+'/'+str(level)
+            print(name, format(g,'#'), len(g), file=out, flush=True)
+
+            def construct():
+                start = time.perf_counter()
+                make()
+                return time.perf_counter()-start
+            results[name+'/construct'] = best(construct, repeat)
+
+            for t in tasks:
+                def timed():
+                    # Tasks cache their answers, so every run gets its own group
+                    g = make()
+                    start = time.perf_counter()
+                    if table:
+                        g.table()
+                    TASKS[t](g)
+                    return time.perf_counter()-start
+                results[name+'/'+t] = best(timed, repeat)
+                print('\t'+t, '%.6f s' % results[name+'/'+t], file=out, flush=True)
+    return results
+
+def compare(results, baseline, threshold, floor):
+    # Benchmarks slower than baseline by more than threshold (a fraction), ignoring anything under floor seconds
+    regressions = []
+    for k, t in sorted(results.items()):
+        b = baseline.get(k)
+        if b != None and t > floor and t > b*(1+threshold):
+            regressions.append((k, b, t))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time group construction and the groups.py tasks across a size ladder of every group family. Sample input:\
+                    \'python bench_groups.py -f S GL -l 2 --save baseline.json\', then later \'python bench_groups.py -f S GL -l 2 --baseline baseline.json\'')
+    parser.add_argument('-f', '--families', nargs='+', default=list(LADDER), choices=list(LADDER), metavar='family',
+                        help='The group families to run. Default is all of: '+', '.join(LADDER))
+    parser.add_argument('-t', '--tasks', nargs='+', default=list(TASKS), choices=list(TASKS), metavar='task',
+                        help='The tasks to time. Default is all of: '+', '.join(TASKS))
+    parser.add_argument('-l', '--levels', type=int, default=3,
+                        help='How many rungs of each size ladder to climb, 1 to 3. Default is 3.')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Runs per benchmark, the best is kept. Default is 3.')
+    parser.add_argument('--table', action="store_true",
+                        help='Build the Cayley table before each task, as groups.py --table does.')
+    parser.add_argument('--save', metavar='file',
+                        help='Write the results to this JSON file, for use as a later baseline.')
+    parser.add_argument('--baseline', metavar='file',
+                        help='Compare against a JSON file written by --save, exiting with 1 on a regression.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Slowdown over the baseline, as a fraction, that counts as a regression. Default is 0.25.')
+    parser.add_argument('--floor', type=float, default=0.005,
+                        help='Timings under this many seconds are too noisy to flag. Default is 0.005.')
+    args = parser.parse_args()
+
+    results = run(args.families, args.levels, args.tasks, args.repeat, args.table)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': numpy.__version__,
+                       'machine': platform.machine(), 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold, args.floor)
+        print()
+        for k, b, t in regressions:
+            print('regression:', k, '%.6f s -> %.6f s (%+.0f%%)' % (b, t, 100*(t/b-1)))
+        print(len(regressions), 'regressions of', len([k for k in results if k in baseline]), 'benchmarks compared')
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,370 @@
+import concurrent.futures
+import os
+import pickle
+import tempfile
+import weakref
+import numpy
+
+class CodeIndex:
+    # Maps int64 element codes back to element indices, -1 for codes of no element. A direct
+    # lookup table is used only when the code space is small and at most LUT_RATIO times the
+    # set, about 2KB per element (S(7) is 163 times), otherwise a sorted search
+    LUT_RATIO = 256
+
+    def __init__(self, codes, size=None):
+        self.n = len(codes)
+        if size != None and size <= 1<<24 and size <= self.LUT_RATIO*max(self.n, 1024):
+            self.lut = numpy.full(size, -1, dtype=numpy.int64)
+            self.lut[codes[codes >= 0]] = numpy.nonzero(codes >= 0)[0]
+        else:
+            self.order = numpy.argsort(codes)
+            self.sorted = codes[self.order]
+
+    def find(self, codes):
+        if self.n == 0:
+            return numpy.full(len(codes), -1, dtype=numpy.int64)
+        if hasattr(self, 'lut'):
+            return numpy.where(codes >= 0, self.lut[numpy.maximum(codes, 0)], -1)
+        pos = numpy.minimum(numpy.searchsorted(self.sorted, codes), self.n-1)
+        return numpy.where((self.sorted[pos] == codes) & (codes >= 0), self.order[pos], -1)
+
+class CayleyTable:
+    def __init__(self, elements, table, index=None, e=None, jobs=1):
+        self.elements = list(elements)
+        self.index = index if index != None else {x: i for i, x in enumerate(self.elements)}
+        self.table = table
+        # Unsigned (on-disk) tables mark products outside the set with the dtype's max
+        self.missing = numpy.iinfo(table.dtype).max if table.dtype.kind == 'u' else -1
+        self.e = self.index.get(e) if e != None else None
+        # Whole-table passes are split over this many processes when the table is a file
+        self.jobs = jobs
+
+    @classmethod
+    def load(cls, path, e=None, mmap_mode='r', jobs=1):
+        # A table written by save(), memory-mapped so processes can share it read-only
+        path = path[:-4] if path.endswith('.npy') else path
+        with open(path+'.elements', 'rb') as f:
+            elements = pickle.load(f)
+        return cls(elements, numpy.load(path+'.npy', mmap_mode=mmap_mode), e=e, jobs=jobs)
+
+    @classmethod
+    def build(cls, elements, rows, index=None, e=None, jobs=1, block=1024):
+        # A table written by jobs processes into a temporary file, removed with the table
+        n = len(elements)
+        fd, path = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        out = numpy.lib.format.open_memmap(path, mode='w+', dtype=table_dtype(n), shape=(n, n))
+        del out
+        write_rows(path, n, rows, block, jobs)
+        t = cls(elements, numpy.load(path, mmap_mode='r'), index, e, jobs)
+        weakref.finalize(t, os.remove, path)
+        return t
+
+    def save(self, path, block=1024):
+        def rows(start, stop):
+            r = self.table[start:stop]
+            return numpy.where(r == self.missing, -1, r.astype(numpy.int64))
+        write_table(path, self.elements, rows, block)
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __getitem__(self, key):
+        return self.table[key]
+
+    def element(self, i):
+        return self.elements[i] if i != self.missing else None
+
+    def indices(self, l):
+        # Positions of the elements in l, or None if any element is not indexed
+        idx = []
+        for x in l:
+            i = self.index.get(x)
+            if i == None:
+                return None
+            idx.append(i)
+        return numpy.array(idx, dtype=numpy.int64)
+
+    def blocks(self, f, *args):
+        # f(path, *args, start, stop) over blocks of rows in jobs processes, each mapping the
+        # table file itself so only the path and the row range are sent; None when there is no
+        # file to map or only one job
+        path = getattr(self.table, 'filename', None)
+        n = len(self)
+        if self.jobs <= 1 or path == None or n < 2:
+            return None
+        step = -(-n//(4*self.jobs))
+        with concurrent.futures.ProcessPoolExecutor(self.jobs) as pool:
+            return [r.result() for r in [pool.submit(f, path, *args, start, min(n, start+step)) for start in range(0, n, step)]]
+
+    def closed(self):
+        if not hasattr(self, '_closed'):
+            blocks = self.blocks(_closed_block)
+            self._closed = all(blocks) if blocks != None else not (self.table == self.missing).any()
+        return self._closed
+
+    def orders(self):
+        if self.e == None:
+            return numpy.zeros(len(self), dtype=numpy.int64)
+        blocks = self.blocks(_orders_block, self.e)
+        if blocks != None:
+            return numpy.concatenate(blocks)
+        return element_orders(self.table, self.e, self.missing, numpy.arange(len(self)))
+
+    def inverses(self):
+        inv = numpy.full(len(self), self.missing, dtype=self.table.dtype)
+        if self.e != None:
+            rows, cols = numpy.nonzero(self.table == self.e)
+            inv[rows[::-1]] = cols[::-1]
+        return inv
+
+    def commuting(self):
+        # Products outside the set are all the same missing marker, so this and the methods
+        # built on it only hold for a closed table
+        return self.table == self.table.T
+
+    def central(self, idx=None):
+        # Mask of the elements commuting with every element of idx, or with everything
+        blocks = self.blocks(_central_block, idx)
+        if blocks != None:
+            return numpy.concatenate(blocks)
+        if idx is None:
+            return self.commuting().all(axis=1)
+        return (self.table[:, idx] == self.table[idx, :].T).all(axis=1)
+
+    def abelian(self):
+        return bool(self.central().all())
+
+    def center(self):
+        return numpy.nonzero(self.central())[0]
+
+    def centralizer(self, idx):
+        return numpy.nonzero(self.central(idx))[0]
+
+    def cyclic(self):
+        return numpy.nonzero(self.orders() == len(self))[0]
+
+    def conjugacy_classes(self):
+        # Orbits g x g^-1 over all g at once, marking visited indices
+        inv = self.inverses()
+        visited = numpy.zeros(len(self), dtype=bool)
+        classes = []
+        for x in range(len(self)):
+            if not visited[x]:
+                gx = self.table[:, x]
+                ok = (gx != self.missing) & (inv != self.missing)
+                c = numpy.unique(self.table[gx[ok], inv[ok]])
+                c = c[c != self.missing]
+                if x not in c:
+                    c = numpy.union1d(c, [x])
+                visited[c] = True
+                classes.append(c)
+        return classes
+
+    def generated(self, gens, mask=None):
+        # Bool mask of the subgroup generated by gens, grown a layer of left cosets of mask at a time
+        n = len(self)
+        if mask is None:
+            mask = numpy.zeros(n, dtype=bool)
+            mask[self.e] = True
+        else:
+            mask = mask.copy()
+        h = numpy.nonzero(mask)[0]
+        # By Lagrange, a subgroup with more than n/p elements (p the least prime of n) is everything
+        p = next((p for p in range(2, int(n**0.5)+1) if n%p == 0), n)
+        size = len(h)
+        reps = numpy.array([self.e])
+        gens = numpy.array(gens, dtype=numpy.int64)
+        while len(reps):
+            y = self.table[gens[:, None], reps[None, :]].ravel()
+            y = y[y != self.missing]
+            y = y[~mask[y]]
+            if not len(y):
+                break
+            c = self.table[y[:, None], h[None, :]]
+            # One representative per coset, its least element
+            reps = numpy.unique(numpy.where(c == self.missing, n, c).min(axis=1))
+            reps = reps[reps < n]
+            mask[c[c != self.missing]] = True
+            size += len(reps)*len(h)
+            if size*p > n:
+                mask[:] = True
+                break
+        return mask
+
+    def conjugates(self, mask):
+        # The distinct subgroups g^-1 H g over all g, by bitset, each with one such g
+        h = numpy.nonzero(mask)[0]
+        inv = self.inverses()
+        c = self.table[self.table[inv[:, None], h[None, :]], numpy.arange(len(self))[:, None]]
+        out = {}
+        for g, row in enumerate(c):
+            m = numpy.zeros(len(self), dtype=bool)
+            m[row] = True
+            out.setdefault(bits(m), (m, g))
+        return out
+
+    def subgroup_lattice(self):
+        # Every subgroup as a join of cyclic subgroups of prime power order. Only one subgroup
+        # per conjugacy class is extended and its class is added whole, deduplicated on the
+        # bitsets. Returns [(bitset, generators)] smallest first and the covering pairs (i, j)
+        orders = self.orders()
+        inv = self.inverses()
+        found = {}
+        reps = []
+        def add(mask, gens):
+            key = bits(mask)
+            if key not in found:
+                reps.append(key)
+                for k, (m, g) in self.conjugates(mask).items():
+                    found[k] = (m, [int(self.table[self.table[inv[g], x], g]) for x in gens])
+                found[key] = (mask, gens)
+        cyclic = set()
+        extenders = []
+        for x in numpy.argsort(orders, kind='stable'):
+            if orders[x] > 0:
+                mask = self.generated([x])
+                key = bits(mask)
+                if key not in cyclic:
+                    cyclic.add(key)
+                    if prime_power(orders[x]):
+                        extenders.append(x)
+                add(mask, [int(x)])
+        for key in reps:
+            mask, gens = found[key]
+            for x in extenders:
+                if not mask[x]:
+                    add(self.generated(gens+[x], mask), gens+[int(x)])
+        keys = sorted(found, key=lambda k: (bin(k).count('1'), k))
+        return [(k, found[k][1]) for k in keys], covers(keys)
+
+    def cosets(self, idx, left=True):
+        if left:
+            return cosets(len(self), idx, lambda a, idx: self.table[a, idx], self.missing)
+        return cosets(len(self), idx, lambda a, idx: self.table[idx, a], self.missing)
+
+def cosets(n, idx, product, missing=-1):
+    # Label every element with its coset in one pass, product(a, idx) gives the indices of a*h
+    labels = numpy.full(n, -1, dtype=numpy.int64)
+    labels[idx] = 0
+    cosets = [idx]
+    for a in range(n):
+        if labels[a] < 0:
+            c = product(a, idx)
+            c = c[c != missing]
+            labels[c] = len(cosets)
+            cosets.append(c)
+    return cosets
+
+def element_orders(table, e, missing, r):
+    # Orders of the elements r, walking all their powers at once; 0 where e is never reached
+    n = len(table)
+    orders = numpy.zeros(len(r), dtype=numpy.int64)
+    cur = r.copy()
+    live = numpy.ones(len(r), dtype=bool)
+    for k in range(1, n+1):
+        found = live & (cur == e)
+        orders[found] = k
+        live &= ~found
+        if not live.any():
+            break
+        cur[live] = table[cur[live], r[live]]
+        live &= cur != missing
+    return orders
+
+# Worker side of CayleyTable.blocks and write_rows: tables mapped once per process, and the
+# row function sent to each process once
+_mapped = {}
+_rows = None
+
+def _map(path, mode='r'):
+    if (path, mode) not in _mapped:
+        _mapped[(path, mode)] = numpy.load(path, mmap_mode=mode)
+    return _mapped[(path, mode)]
+
+def _closed_block(path, start, stop):
+    t = _map(path)
+    return not (t[start:stop] == numpy.iinfo(t.dtype).max).any()
+
+def _orders_block(path, e, start, stop):
+    t = _map(path)
+    return element_orders(t, e, numpy.iinfo(t.dtype).max, numpy.arange(start, stop))
+
+def _central_block(path, idx, start, stop):
+    t = _map(path)
+    if idx is None:
+        return (t[start:stop] == t[:, start:stop].T).all(axis=1)
+    return (t[start:stop][:, idx] == t[idx, start:stop].T).all(axis=1)
+
+def _set_rows(rows):
+    global _rows
+    _rows = rows
+
+def _write_block(path, start, stop):
+    out = _map(path, 'r+')
+    r = _rows(start, stop)
+    out[start:stop] = numpy.where(r < 0, numpy.iinfo(out.dtype).max, r)
+    out.flush()
+
+def write_rows(path, n, rows, block=1024, jobs=1):
+    # Fill the n x n .npy table at path from rows(start, stop), -1 for missing products. With
+    # jobs, rows is sent once to each process and every block is written into the file there
+    if jobs > 1 and n > 1:
+        step = max(1, min(block, -(-n//(4*jobs))))
+        with concurrent.futures.ProcessPoolExecutor(jobs, initializer=_set_rows, initargs=(rows,)) as pool:
+            for r in [pool.submit(_write_block, path, start, min(n, start+step)) for start in range(0, n, step)]:
+                r.result()
+        return
+    out = numpy.load(path, mmap_mode='r+')
+    missing = numpy.iinfo(out.dtype).max
+    for start in range(0, n, block):
+        r = rows(start, min(n, start+block))
+        out[start:start+len(r)] = numpy.where(r < 0, missing, r)
+    out.flush()
+    del out
+
+def table_dtype(n):
+    # The smallest unsigned type holding every index with its max left over for missing products
+    return numpy.uint16 if n < 0xffff else numpy.uint32
+
+def write_table(path, elements, rows, block=1024, jobs=1):
+    # Write <path>.npy a block of rows at a time from rows(start, stop), with the elements
+    # pickled to <path>.elements; the whole table is never held in memory. Both are written
+    # under temporary names and moved into place, the .npy last, so a .npy is always complete
+    path = path[:-4] if path.endswith('.npy') else path
+    n = len(elements)
+    tmp = '.tmp'+str(os.getpid())
+    out = numpy.lib.format.open_memmap(path+'.npy'+tmp, mode='w+', dtype=table_dtype(n), shape=(n, n))
+    del out
+    write_rows(path+'.npy'+tmp, n, rows, block, jobs)
+    with open(path+'.elements'+tmp, 'wb') as f:
+        pickle.dump(list(elements), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path+'.elements'+tmp, path+'.elements')
+    os.replace(path+'.npy'+tmp, path+'.npy')
+
+def bits(mask):
+    # A bool mask as a Python int bitset, so subsets hash and compare in O(1) words
+    return int.from_bytes(numpy.packbits(mask, bitorder='little').tobytes(), 'little')
+
+def unbits(m, n):
+    return numpy.unpackbits(numpy.frombuffer(m.to_bytes((n+7)//8, 'little'), dtype=numpy.uint8), count=n, bitorder='little').astype(bool)
+
+def prime_power(n):
+    if n < 2:
+        return False
+    p = next((p for p in range(2, int(n**0.5)+1) if n%p == 0), n)
+    while n%p == 0:
+        n //= p
+    return n == 1
+
+def covers(keys):
+    # Pairs (i, j) with keys[i] maximal among the proper subsets of keys[j], keys sorted by size
+    edges = []
+    for j, b in enumerate(keys):
+        # Going down from the largest, a subset is maximal unless a maximal one already holds it
+        maximal = []
+        for i in range(j-1, -1, -1):
+            if keys[i] & b == keys[i] and not any(keys[i] & keys[k] == keys[i] for k in maximal):
+                maximal.append(i)
+        edges += [(i, j) for i in reversed(maximal)]
+    return edges
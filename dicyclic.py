@@ -0,0 +1,66 @@
+import functools
+from math import cos, sin, pi
+
+from quaternion import Quaternion
+
+@functools.total_ordering
+class Dicyclic:
+    # a^k x^f in <a, x | a^2n = 1, x^2 = a^n, x a x^-1 = a^-1>, kept as exact integers
+    __slots__ = ('n', 'k', 'f', '_hash')
+
+    def __init__(self, n, k=0, f=0):
+        self.n = n
+        self.k = k%(2*n) if n else 0
+        self.f = f%2
+        self._hash = hash((self.n, self.k, self.f))
+
+    def quaternion(self):
+        # The unit quaternion this element stands for, a = e^(i*pi/n) and x = j
+        a = Quaternion(r=cos(pi*self.k/self.n), i=sin(pi*self.k/self.n)) if self.n else Quaternion(r=1.0)
+        return a*Quaternion(j=1.0) if self.f else a
+
+    def __format__(self, format_spec):
+        return self.__str__()
+
+    def __str__(self):
+        st = ''
+        if self.k:
+            st += 'a' if self.k == 1 else 'a^'+str(self.k)
+        if self.f:
+            st += 'x'
+        return st if st!='' else 'e'
+
+    __repr__ = __str__
+
+    def __hash__(self):
+        return self._hash
+
+    def __mul__(self, other):
+        if isinstance(other, Dicyclic):
+            if not self.f:
+                return Dicyclic(self.n, self.k+other.k, other.f)
+            # x a^m = a^-m x, and x^2 = a^n
+            if other.f:
+                return Dicyclic(self.n, self.k-other.k+self.n, 0)
+            return Dicyclic(self.n, self.k-other.k, 1)
+        if other == 1:
+            return self
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def identity(self):
+        return Dicyclic(self.n)
+
+    def inverse(self):
+        if self.f:
+            return Dicyclic(self.n, self.k+self.n, 1)
+        return Dicyclic(self.n, -self.k, 0)
+
+    def __eq__(self, other):
+        if not isinstance(other, Dicyclic):
+            return False
+        return self.n == other.n and self.k == other.k and self.f == other.f
+
+    def __lt__(self, other):
+        return hash(self) < hash(other)
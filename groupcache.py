@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import numpy
+
+from operations import Operation
+from cayley import CayleyTable, table_dtype
+
+VERSION = 2
+
+def describe(x):
+    # Stable text for a group argument, naming operations and groups rather than listing them
+    if isinstance(x, Operation):
+        return '<'+x.name+'>'
+    if isinstance(x, (list, tuple)):
+        return '['+','.join(describe(i) for i in x)+']'
+    if isinstance(x, (int, float, str)) or x is None:
+        return repr(x)
+    return type(x).__name__+'{'+format(x, '#')+'}'
+
+def group_key(group, args=(), kwargs={}):
+    d = group.__name__+'('+','.join([describe(a) for a in args]+[k+'='+describe(kwargs[k]) for k in sorted(kwargs)])+')'
+    return hashlib.sha256((str(VERSION)+d).encode()).hexdigest()
+
+def element_digest(l):
+    # The elements' text in order, so an entry is only applied to a group listed the same way
+    h = hashlib.sha256()
+    for x in l:
+        h.update(str(x).encode()+b'\n')
+    return h.hexdigest()
+
+class GroupCache:
+    # A group's computed invariants, one entry per group definition: <key>.json holds the scalar
+    # invariants and element results as indices into the group's elements, <key>.npy its Cayley
+    # table. Nothing is unpickled; the group and its operation are constructed from the
+    # definition as usual, and an entry that does not check out against it is dropped.
+    def __init__(self, directory, max_bytes=1<<30):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, group, args=(), kwargs={}):
+        return group_key(group, args, kwargs)
+
+    def path(self, key):
+        return os.path.join(self.directory, key+'.json')
+
+    def table_path(self, key):
+        return os.path.join(self.directory, key+'.npy')
+
+    def load(self, key, g):
+        # Sets the cached invariants on g and returns it, or None with g untouched on a miss
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if entry.get('version') != VERSION or entry.get('key') != key:
+                raise ValueError('cache key mismatch')
+            state = self.decode(key, entry, g)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Anything unreadable is dropped and recomputed
+            self.remove(key)
+            return None
+        g.__dict__.update(state)
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        return g
+
+    def decode(self, key, entry, g):
+        inv = entry['invariants']
+        state = {}
+        if 'abelian' in inv:
+            state['_abelian'] = bool(inv['abelian'])
+        if g._l == None:
+            # A lazy group only takes its length, which would otherwise be counted again
+            state['_len'] = int(entry['length'])
+            return state
+        l = g.l
+        n = len(l)
+        if entry['length'] != n or entry['elements'] != element_digest(l):
+            raise ValueError('cache elements mismatch')
+        def elements(idx):
+            if not all(isinstance(i, int) and 0 <= i < n for i in idx):
+                raise ValueError('cache index out of range')
+            return [l[i] for i in idx]
+        if 'center' in inv:
+            state['_center'] = elements(inv['center'])
+        if 'generating_set' in inv:
+            state['_generating_set'] = None if inv['generating_set'] is None else elements(inv['generating_set'])
+        if 'cyclic' in inv:
+            state['_cyclic'] = (bool(inv['cyclic'][0]), elements(inv['cyclic'][1]))
+        if 'orders' in inv:
+            if len(inv['orders']) != n or not all(k is None or isinstance(k, int) for k in inv['orders']):
+                raise ValueError('cache orders mismatch')
+            state['_orders'] = dict(zip(l, inv['orders']))
+        if 'classes' in inv:
+            state['_classes'] = [elements(c) for c in inv['classes']]
+        if entry.get('table'):
+            t = numpy.load(self.table_path(key), mmap_mode='r', allow_pickle=False)
+            dtype = table_dtype(n)
+            if t.shape != (n, n) or t.dtype != dtype or not ((t < n) | (t == numpy.iinfo(dtype).max)).all():
+                raise ValueError('cache table mismatch')
+            state['_table'] = CayleyTable(l, t, g.index(), g.e)
+        return state
+
+    def encode(self, key, g):
+        inv = {}
+        entry = {'version': VERSION, 'key': key, 'length': len(g), 'invariants': inv}
+        if hasattr(g, '_abelian'):
+            inv['abelian'] = bool(g._abelian)
+        if g._l == None:
+            return entry
+        entry['elements'] = element_digest(g._l)
+        index = g.index()
+        def indices(xs):
+            # Only the group's own element objects: a product equal to one can print differently
+            idx = [index[x] for x in xs]
+            if any(g._l[i] is not x for i, x in zip(idx, xs)):
+                raise KeyError('not an element of the list')
+            return idx
+        encoders = {'center': lambda: indices(g._center),
+                    'generating_set': lambda: None if g._generating_set == None else indices(g._generating_set),
+                    'cyclic': lambda: [bool(g._cyclic[0]), indices(g._cyclic[1])],
+                    'orders': lambda: [None if g._orders[x] == None else int(g._orders[x]) for x in g._l],
+                    'classes': lambda: [indices(c) for c in g._classes]}
+        for k, encode in encoders.items():
+            if hasattr(g, '_'+k):
+                try:
+                    inv[k] = encode()
+                except (KeyError, TypeError):
+                    # Results holding anything but the group's own elements are left out
+                    pass
+        entry['table'] = hasattr(g, '_table') and len(g._table) == len(g._l)
+        return entry
+
+    def save(self, key, g, block=1024):
+        entry = self.encode(key, g)
+        path = self.path(key)
+        tmp = '.tmp'+str(os.getpid())
+        if entry.get('table'):
+            # The table goes in first, and is left alone when it is the one this entry loaded
+            t = g._table
+            dest = self.table_path(key)
+            if not (isinstance(t.table, numpy.memmap) and os.path.abspath(t.table.filename) == os.path.abspath(dest)):
+                n = len(t)
+                dtype = table_dtype(n)
+                out = numpy.lib.format.open_memmap(dest+tmp, mode='w+', dtype=dtype, shape=(n, n))
+                for start in range(0, n, block):
+                    r = t.table[start:start+block]
+                    out[start:start+len(r)] = numpy.where(r == t.missing, numpy.iinfo(dtype).max, r)
+                out.flush()
+                del out
+                os.replace(dest+tmp, dest)
+        else:
+            try:
+                os.remove(self.table_path(key))
+            except OSError:
+                pass
+        with open(path+tmp, 'w') as f:
+            json.dump(entry, f)
+        os.replace(path+tmp, path)
+        self.evict(keep=key)
+
+    def remove(self, key):
+        for path in (self.path(key), self.table_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self, keep=None):
+        # Drop least recently used entries until the directory fits in max_bytes
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                key = name[:-5]
+                size = 0
+                try:
+                    mtime = os.stat(self.path(key)).st_mtime
+                    for p in (self.path(key), self.table_path(key)):
+                        if os.path.exists(p):
+                            size += os.stat(p).st_size
+                except OSError:
+                    continue
+                entries.append((mtime, size, key))
+        total = sum(e[1] for e in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self.remove(key)
+                total -= size
@@ -1,15 +1,28 @@
 import itertools
+import os
+import pickle
 import functools
+import concurrent.futures
 import argparse
+import contextlib
+import io
+import multiprocessing
 import time
 import re
-from math import floor, cos, sin, pi
-from fractions import gcd
+import sys
+import numpy
+from math import floor, factorial, gcd
 
-from operations import getop, ops
+from operations import getop, ops, evaluation_counts
+from cayley import CayleyTable, cosets, bits, unbits, write_table, table_dtype
 from matrix import *
 from permutation import *
 from quaternion import *
+from dicyclic import Dicyclic
+from stabilizer import StabilizerChain
+from groupcache import GroupCache, group_key
+from instrument import Instrument, write_report
+from output import WRITERS
 
 class FiniteGroup:
     def print_help():
@@ -25,37 +38,115 @@ class FiniteGroup:
         self.e = e
         self.name = name
 
-        if self.e == None:
+        if getattr(self.op, 'keyed', False) and self._l != None:
+            self.op.index(self._l)
+        if self.e == None and self._l != None:
             self.identity()
+        self._init_caches()
 
-        @functools.lru_cache(len(self.l)**2)
+    def _init_caches(self):
+        # Sized by the stored elements; a lazy group is not enumerated just to size its caches
+        n = len(self._l) if self._l != None else 1<<12
+
+        @functools.lru_cache(n*n)
         def _power(i, p):
-            term = i
-            for k in range(p-1):
-                term = self.op(term,i)
-            return term
+            # Square and multiply, O(log p) products
+            term = None
+            while p > 1:
+                if p%2:
+                    term = i if term == None else self.op(term,i)
+                i = self.op(i,i)
+                p //= 2
+            return i if term == None else self.op(term,i)
         self.power = _power
 
-        @functools.lru_cache(len(self.l))
+        @functools.lru_cache(n)
         def _order(i):
-            for k in range(1, len(self.l)+1):
-                if self.power(i,k) == self.e:
-                    return k
+            return self.element_order(i)
         self.order = _order
 
+    def __getstate__(self):
+        # The memoized closures and anything rebuilt from the table or elements are left out
+        state = dict(self.__dict__)
+        for k in ('power', 'order', '_cayley', '_array', '_index'):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_caches()
+
+    def element_order(self, i):
+        # In a group the order divides |G|, so try its divisors with fast powers first
+        n = len(self)
+        divisors = [d for d in range(1, int(n**0.5)+1) if n%d == 0]
+        for d in divisors+[n//d for d in reversed(divisors) if d*d != n]:
+            if self.power(i,d) == self.e:
+                return d
+        # Otherwise walk successive powers, one product per step
+        term = i
+        for k in range(1, n+1):
+            if term == self.e:
+                return k
+            term = self.op(term,i)
+        return None
+
+    @property
+    def l(self):
+        if self._l == None:
+            self._l = list(self.elements())
+        return self._l
+
+    @l.setter
+    def l(self, l):
+        self._l = l
+
+    def elements(self):
+        return iter(self._l)
+
     def identity(self):
-        if self.e == None and len(self.l)>0:
-            for i in self.l:
-                for j in self.l:
-                    res = self.op(i,j)
-                    if res != j:
-                        self.e = None
-                        break
-                    self.e = i
-                if self.e != None:
+        # O(|G|) products per candidate: the element type's own identity, then the identity a
+        # generator's powers cycle through, then the idempotents (every identity is one, and a
+        # group has no other)
+        if self.e == None and len(self)>0:
+            members = self.index() if self._l != None else self
+            candidates = [self.identity_hint(next(iter(self)))]
+            if hasattr(self, 'generators') and self.generators:
+                candidates.append(self.power_cycle(self.generators[0]))
+            for c in candidates:
+                if c is not None and c in members and self.is_identity(c):
+                    self.e = self._l[members[c]] if self._l != None else c
+                    return self.e
+            for x in self:
+                if self.op(x,x) == x and self.is_identity(x):
+                    self.e = x
                     break
         return self.e
 
+    def identity_hint(self, x):
+        # The identity the operation would have on elements like x, if its type knows one
+        t = getattr(self.op, 'type', None)
+        if t in ('add', 'addmod'):
+            return x*0 if isinstance(x, (int, Matrix)) else None
+        if t in ('mult', 'multmod', 'matrixmod'):
+            if isinstance(x, int):
+                return 1
+            return x.identity() if hasattr(x, 'identity') else None
+        return None
+
+    def power_cycle(self, g):
+        # g^k where g^(k+1) == g, which in a group is the identity
+        prev, cur = g, self.op(g,g)
+        for _ in range(len(self)):
+            if cur == g:
+                return prev
+            prev, cur = cur, self.op(cur,g)
+        return None
+
+    def is_identity(self, e):
+        # A left identity, as in a group it is the identity
+        return all(self.op(e,x) == x for x in self)
+
     def __hash__(self):
         if not hasattr(self, '_hash'):
             self._hash = hash(frozenset(self.l))
@@ -67,6 +158,8 @@ class FiniteGroup:
         return str(self)
 
     def __str__(self):
+        if self._l == None:
+            return '('+', '.join((str(self.name), str(self.op)))+')'
         return '('+', '.join(('['+', '.join([format(i, '#') for i in self.l])+']', str(self.op)))+')'
 
     __repr__ = __str__
@@ -75,29 +168,135 @@ class FiniteGroup:
         return len(self.l)
 
     def __iter__(self):
-        for e in self.l:
-            yield e
+        # Lazy groups stream their elements without storing them
+        return iter(self._l) if self._l != None else self.elements()
 
     def __contains__(self, i):
         return i in self.l
 
     def __eq__(self, other):
-        return self.op == other.op and self.sorted() == other.sorted()
+        if self.op != other.op:
+            return False
+        if self.same_parent(other):
+            return self._mask == other._mask
+        return len(self) == len(other) and self<=other
 
     def __le__(self, other):
-        return self.op == other.op and set(self.l).issubset(set(other.l))
+        if self.op != other.op:
+            return False
+        if self.same_parent(other):
+            return self._mask & other._mask == self._mask
+        if getattr(self, 'parent', None) is other:
+            return True
+        if other._l == None:
+            return all(x in other for x in self)
+        return other.mask(self) != None
 
     def __lt__(self, other):
         return self<=other and self!=other
 
+    def same_parent(self, other):
+        # Both are bitsets over one parent group
+        p = getattr(self, 'parent', None)
+        return p is not None and p is getattr(other, 'parent', None)
+
+    def mask(self, l):
+        # The elements of l as a Python int bitset over this group's index, None if one is missing
+        if getattr(l, 'parent', None) is self:
+            return l._mask
+        index = self.index()
+        m = numpy.zeros(len(self), dtype=bool)
+        for x in l:
+            i = index.get(x)
+            if i == None:
+                return None
+            m[i] = True
+        return bits(m)
+
+    def subset(self, m, name=None):
+        # The elements picked out by a bitset over this group's index, keeping the bitset
+        sel = unbits(m, len(self))
+        i = self.index().get(self.e) if self.e != None else None
+        h = FiniteGroup([x for x, k in zip(self.l, sel) if k], self.op, self.e if i != None and sel[i] else None, name)
+        h.parent = self
+        h._mask = m
+        return h
+
     def sorted(self):
         if not hasattr(self, '_sorted'):
             self._sorted = sorted(self.l)
         return list(self._sorted)
 
+    def index(self):
+        if not hasattr(self, '_index'):
+            self._index = {}
+            for i, x in enumerate(self.l):
+                self._index.setdefault(x, i)
+        return self._index
+
+    def _table_rows(self, start, stop):
+        # Rows [start, stop) of the integer Cayley table, -1 where a product leaves the group
+        index = self.index()
+        rows = numpy.full((stop-start, len(self.l)), -1, dtype=numpy.int32)
+        for i in range(start, stop):
+            a = self.l[i]
+            for j, b in enumerate(self.l):
+                rows[i-start, j] = index.get(self.op(a,b), -1)
+        return rows
+
+    def table(self, jobs=1):
+        if not hasattr(self, '_table'):
+            n = len(self.l)
+            if jobs > 1 and n > 1:
+                # Workers write their rows straight into a table file, which the orders, center
+                # and centralizer passes then split between them too
+                self._table = CayleyTable.build(self.l, self.row_source(), self.index(), self.e, jobs)
+            else:
+                self._table = CayleyTable(self.l, self._table_rows(0, n), self.index(), self.e)
+        return self._table
+
+    def row_source(self):
+        # What table workers are sent to compute rows(start, stop) with. Here that is the
+        # group itself, as only it can multiply its elements; groups with an integer encoding
+        # of their elements send that instead
+        return self._table_rows
+
+    def table_rows(self, start, stop):
+        # Rows [start, stop) of the integer Cayley table, from the built table when there is one
+        if hasattr(self, '_table'):
+            r = self._table.table[start:stop]
+            return numpy.where(r == self._table.missing, -1, r.astype(numpy.int64))
+        return self._table_rows(start, stop)
+
+    def save_table(self, path, block=1024, jobs=1):
+        # Streams the table to disk a block of rows at a time when it is not already built, with
+        # jobs processes each writing their blocks into the file
+        if hasattr(self, '_table'):
+            self._table.save(path, block)
+        else:
+            write_table(path, self.l, self.row_source() if jobs > 1 else self._table_rows, block, jobs)
+
+    def load_table(self, path, mmap_mode='r', jobs=1):
+        t = CayleyTable.load(path, self.e, mmap_mode, jobs)
+        n = len(self.l)
+        if t.table.shape != (n, n) or t.table.dtype != table_dtype(n):
+            raise ValueError('Table at '+path+' is not a '+str(n)+'x'+str(n)+' '+numpy.dtype(table_dtype(n)).name+' table')
+        if t.elements != self.l:
+            raise ValueError('Table elements at '+path+' do not match '+format(self,'#'))
+        self._table = t
+        return t
+
     def cayley(self):
         if not hasattr(self, '_cayley'):
             self._cayley = {}
+            if hasattr(self, '_table'):
+                t = self._table
+                l = [(t.index[a], a) for a in self.sorted()]
+                for i, a in l:
+                    for j, b in l:
+                        k = t[i, j]
+                        self._cayley[(a,b)] = t.elements[k] if k != t.missing else self.op(a,b)
+                return self._cayley
             l = self.sorted()
             r = self.sorted()
             for i in l:
@@ -114,6 +313,10 @@ class FiniteGroup:
     def orders(self):
         if not hasattr(self, '_orders'):
             self._orders = {}
+            if hasattr(self, '_table'):
+                for i, k in zip(self._table.elements, self._table.orders().tolist()):
+                    self._orders[i] = k if k else None
+                return self._orders
             for i in self.l:
                 self._orders[i] = self.order(i)
         return self._orders
@@ -131,17 +334,66 @@ class FiniteGroup:
     def cyclic(self):
         if not hasattr(self, '_cyclic'):
             c = []
-            for i in self.l:
-                # print(i,flush=True)
-                if self.sorted() == sorted([self.power(i,k) for k in range(1,self.order(i)+1)] if self.order(i) else []):
-                    c.append(i)
+            if hasattr(self, '_table'):
+                c = [self._table.elements[i] for i in self._table.cyclic()]
+            else:
+                for i in self.l:
+                    # print(i,flush=True)
+                    if self.sorted() == sorted([self.power(i,k) for k in range(1,self.order(i)+1)] if self.order(i) else []):
+                        c.append(i)
             self._cyclic = (len(c) != 0, c)
             if self._cyclic[0] and not hasattr(self, '_abelian'):
                 self._abelian = True
         return self._cyclic
 
+    def generating_set(self):
+        # The group's generators, or for a listed set a greedy choice: each element not yet
+        # generated is added, and the choice is kept only if it generates exactly the set
+        if hasattr(self, 'generators'):
+            return self.generators
+        if not hasattr(self, '_generating_set'):
+            self._generating_set = None
+            index = self.index()
+            gens = []
+            covered = {self.e} if self.e != None else set()
+            for x in self.l:
+                if x not in covered:
+                    gens.append(x)
+                    h = self._generated(gens, index)
+                    if h == None:
+                        return None
+                    covered |= h
+            if len(covered) == len(index):
+                self._generating_set = gens
+        return self._generating_set
+
+    def _generated(self, gens, index):
+        # Breadth-first closure of gens, or None as soon as a product leaves the set
+        l = list(dict.fromkeys(gens))
+        seen = set(l)
+        k = 0
+        while k < len(l):
+            i = l[k]
+            k+=1
+            for g in gens:
+                o = self.op(i,g)
+                if o not in seen:
+                    if o not in index:
+                        return None
+                    seen.add(o)
+                    l.append(o)
+        return seen
+
     def abelian(self):
         if not hasattr(self, '_abelian'):
+            if hasattr(self, '_table') and self._table.closed():
+                self._abelian = self._table.abelian()
+                return self._abelian
+            gens = self.generating_set()
+            if gens != None:
+                # Generators that commute pairwise generate a commutative set
+                self._abelian = all(self.op(a,b) == self.op(b,a) for i, a in enumerate(gens) for b in gens[i+1:])
+                return self._abelian
             self._abelian = True
             for i in self.l:
                 for j in self.l:
@@ -157,6 +409,17 @@ class FiniteGroup:
         if not hasattr(self, '_center'):
             if hasattr(self, '_abelian') and self._abelian:
                 self._center = self.sorted()
+            elif hasattr(self, '_table') and self._table.closed():
+                self._center = [self._table.elements[i] for i in self._table.center()]
+                self._abelian = len(self._center) == len(self._table)
+            elif hasattr(self, '_classes'):
+                self._center = [c[0] for c in self._classes if len(c) == 1]
+                self._abelian = len(self._center) == len(self)
+            elif self.generating_set() != None:
+                # Commuting with every generator is commuting with everything
+                gens = self.generating_set()
+                self._center = [i for i in self.l if all(self.op(i,g) == self.op(g,i) for g in gens)]
+                self._abelian = len(self._center) == len(self)
             else:
                 self._center = []
                 for i in self.l:
@@ -174,6 +437,10 @@ class FiniteGroup:
         return self._center
 
     def centralizer(self, g):
+        if hasattr(self, '_table') and self._table.closed():
+            idx = self._table.indices(g.l)
+            if idx is not None:
+                return [self._table.elements[i] for i in self._table.centralizer(idx)]
         c = []
         for i in self.l:
             go = True
@@ -188,47 +455,127 @@ class FiniteGroup:
     def lcosets(self, h):
         if not h<=self:
             return 'Warning: '+format(h,'#')+' is not a subset of '+format(self,'#')
-        cosets = [h.l]
-        remaining = []
-        for i in self.sorted():
-            if i not in cosets[0]:
-                remaining.append(i)
-        i = 0
-        while remaining:
-            i+=1
-            a = remaining.pop()
-            cosets.append([])
-            for n in cosets[0]:
-                o = self.op(a,n)
-                for j, r in enumerate(remaining):
-                    if r == o:
-                        del remaining[j]
-                        break
-                cosets[i].append(o)
-        return cosets
+        if hasattr(self, '_table'):
+            idx = self._table.indices(h.l)
+            if idx is not None:
+                cosets = self._table.cosets(idx, left=True)
+                return [h.l]+[[self._table.elements[i] for i in c] for c in cosets[1:]]
+        return self._partition(h, True)
 
     def rcosets(self, h):
         if not h<=self:
             return 'Warning: '+h.name+' is not a subset of '+self.name
+        if hasattr(self, '_table'):
+            idx = self._table.indices(h.l)
+            if idx is not None:
+                cosets = self._table.cosets(idx, left=False)
+                return [h.l]+[[self._table.elements[i] for i in c] for c in cosets[1:]]
+        return self._partition(h, False)
+
+    def coset_labels(self, h, left=True):
+        # The coset id of every element, by index, -1 where no coset holds it
+        cosets = self.lcosets(h) if left else self.rcosets(h)
+        if isinstance(cosets, str):
+            return None
+        index = self.index()
+        labels = numpy.full(len(self), -1, dtype=numpy.int64)
+        for k, c in enumerate(cosets):
+            for x in c:
+                i = index.get(x)
+                if i != None and labels[i] < 0:
+                    labels[i] = k
+        return labels
+
+    def is_normal(self, h):
+        # Normal exactly when the left and right coset partitions agree
+        l, r = self.coset_labels(h, True), self.coset_labels(h, False)
+        if l is None or (l < 0).any() or (r < 0).any():
+            return False
+        k = int(l.max())+1
+        return k*len(h) == len(self) and int(r.max())+1 == k and len(numpy.unique(l*k+r)) == k
+
+    def quotient(self, h):
+        # G/H over coset representatives, with its Cayley table induced from the cosets
+        if not self.is_normal(h):
+            return NullGroup()
+        labels = self.coset_labels(h)
+        index = self.index()
+        reps = [None]*(int(labels.max())+1)
+        for i, k in enumerate(labels.tolist()):
+            if reps[k] == None:
+                reps[k] = self.l[i]
+        if self.e != None:
+            reps[labels[index[self.e]]] = self.e
+        if hasattr(self, '_table'):
+            idx = self._table.indices(reps)
+            t = labels[self._table[idx[:, None], idx[None, :]]]
+        else:
+            t = numpy.array([[labels[index[self.op(a,b)]] for b in reps] for a in reps], dtype=numpy.int64)
+        name = format(self,'#')+'/'+format(h,'#')
+        q = FiniteGroup(reps, getop('table', reps, t.tolist(), name, cache=0), reps[labels[index[self.e]]] if self.e != None else None, name=name)
+        q._table = CayleyTable(reps, t, q.index(), q.e)
+        return q
+
+    def _partition(self, h, left):
+        # Mark covered elements in a bool mask over the index, so each coset costs |H| products
+        index = self.index()
+        covered = numpy.zeros(len(self), dtype=bool)
+        for n in h.l:
+            covered[index[n]] = True
         cosets = [h.l]
-        remaining = []
-        for i in self.sorted():
-            if i not in cosets[0]:
-                remaining.append(i)
-        i = 0
-        while remaining:
-            i+=1
-            a = remaining.pop()
-            cosets.append([])
-            for n in cosets[0]:
-                o = self.op(n,a)
-                for j, r in enumerate(remaining):
-                    if r == o:
-                        del remaining[j]
-                        break
-                cosets[i].append(o)
+        for a in reversed(self.sorted()):
+            if covered[index[a]]:
+                continue
+            c = [self.op(a,n) if left else self.op(n,a) for n in h.l]
+            for o in c:
+                i = index.get(o)
+                if i != None:
+                    covered[i] = True
+            cosets.append(c)
         return cosets
 
+    def conjugacy_classes(self):
+        if not hasattr(self, '_classes'):
+            gens = self.generating_set() if not hasattr(self, '_table') else None
+            if gens != None and all(self.order(g) for g in gens):
+                # Invertible generators of the whole set, so conjugating by them alone gives the classes
+                self._classes = self._generator_classes(gens)
+            else:
+                t = self.table()
+                self._classes = [[t.elements[i] for i in c] for c in t.conjugacy_classes()]
+        return self._classes
+
+    def _generator_classes(self, gens, l=None):
+        # Orbits under conjugation by the generators, marking visited element indices
+        l = self.l if l == None else l
+        index = self.index() if l is self.l else {x: i for i, x in enumerate(l)}
+        pairs = [(g, self.power(g, self.order(g)-1)) for g in gens if self.order(g)]
+        visited = numpy.zeros(len(l), dtype=bool)
+        classes = []
+        for i, x in enumerate(l):
+            if visited[i]:
+                continue
+            visited[i] = True
+            c = [x]
+            k = 0
+            while k < len(c):
+                y = c[k]
+                k+=1
+                for g, h in pairs:
+                    z = self.op(self.op(g,y),h)
+                    j = index.get(z)
+                    if j != None and not visited[j]:
+                        visited[j] = True
+                        c.append(z)
+            classes.append(c)
+        return classes
+
+    def class_sizes(self):
+        return sorted(len(c) for c in self.conjugacy_classes())
+
+    def class_equation(self):
+        return str(len(self))+' = '+' + '.join(str(k) for k in self.class_sizes())
+
     def subgroup(self, k):
         if len(self.l) == k:
             return self
@@ -236,9 +583,29 @@ class FiniteGroup:
             return GeneratorGroup(self.revorders()[k][0], self.op)
         return NullGroup()
 
+    def subgroup_lattice(self):
+        # All subgroups, smallest first, and the pairs (i, j) where subs[i] is maximal in subs[j]
+        if not hasattr(self, '_lattice'):
+            t = self.table()
+            if not t.closed() or t.e == None or (t.inverses() == t.missing).any():
+                return None
+            subs, edges = t.subgroup_lattice()
+            self._lattice = ([self._subgroup(m, gens) for m, gens in subs], edges)
+        return self._lattice
+
+    def _subgroup(self, m, gens):
+        if m == (1<<len(self))-1:
+            return self
+        h = self.subset(m, '<'+','.join([format(self.l[i],'#') for i in gens])+'>')
+        h.generators = [self.l[i] for i in gens]
+        return h
+
     def subgroups(self, k):
         if len(self.l) == k:
             return [self]
+        if self.subgroup_lattice() != None:
+            subs = [h for h in self._lattice[0] if len(h) == k]
+            return subs if subs else [NullGroup()]
         subs = []
         if hasattr(self, '_cyclic') and self._cyclic[0]:
             if k in self.revorders():
@@ -266,48 +633,40 @@ class GeneratorGroup(FiniteGroup):
         print('\t','?name = name of the group')
 
     def __init__(self, g, op, name=None):
-        def power_(i, p):
-            term = i
-            for k in range(p-1):
-                term = op(term,i)
-            return term
-
-        d = {}
-        l_g = [g]
+        name = self.set_generators(g, name)
+        super(GeneratorGroup, self).__init__(self.closure(self.generators, op), op, name=name)
+
+    def set_generators(self, g, name=None):
+        self.generators = [g]
         if isinstance(g,list):
-            l_g = g
+            self.generators = g
             if name==None:
                 name = '<'+','.join([format(i,'#') for i in g])+'>'
         elif name==None:
             self._abelian = True
             name = '<'+format(g,'#')+'>'
-        for g in l_g:
-            k = 2
-            if g not in d:
-                d[g] = [g]
-                p = power_(g,k);
-                while not p in d[g]:
-                    d[g].append(p)
-                    k+=1
-                    p = power_(g,k);
+        return name
+
+    @staticmethod
+    def closure(l_g, op):
+        # Breadth-first search of the Cayley graph, multiplying only by generators,
+        # so g^(k+1) comes from g^k in one product and each element is expanded once
         l = []
-        leftover = []
-        for k in d:
-            for i in d[k]:
-                if i not in leftover:
-                    leftover.append(i)
-        while leftover:
-            i = leftover.pop()
-            if not i in l:
-                l.append(i)
-            for j in l:
-                o = op(i,j)
-                if not o in l:
+        seen = set()
+        for g in l_g:
+            if g not in seen:
+                seen.add(g)
+                l.append(g)
+        k = 0
+        while k < len(l):
+            i = l[k]
+            k+=1
+            for g in l_g:
+                o = op(i,g)
+                if o not in seen:
+                    seen.add(o)
                     l.append(o)
-                    if not o in leftover:
-                        leftover.append(o)
-
-        super(GeneratorGroup, self).__init__(l, op, name=name)
+        return l
 
 class MatrixGeneratorGroup(GeneratorGroup):
     def print_help():
@@ -345,7 +704,34 @@ class PermutationGeneratorGroup(GeneratorGroup):
                     g.append(Permutation(h, pname+str(s) if pname!=None else None))
             else:
                 g = Permutation(p, pname)
-        super(PermutationGeneratorGroup, self).__init__(g, getop('mult'), name=name)
+        name = self.set_generators(g, name)
+        self.chain = StabilizerChain(self.generators)
+        FiniteGroup.__init__(self, None, getop('mult'), Permutation([]), name=name)
+
+    def elements(self):
+        if any(g.name!=None for g in self.generators):
+            # Keep the generator names on the products
+            return iter(self.closure(self.generators, self.op))
+        return iter(self.chain)
+
+    def __len__(self):
+        return self.chain.order()
+
+    def __contains__(self, i):
+        return i in self.chain
+
+    def __str__(self):
+        if self._l == None:
+            return '('+', '.join(('<'+', '.join([format(i, '#') for i in self.generators])+'>', str(self.op)))+')'
+        return super(PermutationGeneratorGroup, self).__str__()
+
+    __repr__ = __str__
+
+    def random(self):
+        return self.chain.random()
+
+    def element_order(self, i):
+        return i.order()
 
 class PermutationGroup(FiniteGroup):
     def print_help():
@@ -356,11 +742,63 @@ class PermutationGroup(FiniteGroup):
 
     def __init__(self, l, e=Permutation([]), name=None):
         p = None
-        if len(l)>0 and not isinstance(l[0], Permutation):
+        if l != None and len(l)>0 and not isinstance(l[0], Permutation):
             p = []
             for i in l:
                 p.append(Permutation(i))
-        super(PermutationGroup, self).__init__(p if p != None else l, getop('mult', cache=len(l)**2), e, name=name)
+        super(PermutationGroup, self).__init__(p if p != None else l, getop('mult', cache=len(l)**2) if l != None else getop('mult'), e, name=name)
+
+    def element_order(self, i):
+        # The lcm of the cycle lengths, as long as that many powers fit in the set; sets that are
+        # not groups get None past |G| powers as the generic walk does
+        if self.e == i.identity():
+            o = i.order()
+            return o if o <= len(self) else None
+        return super(PermutationGroup, self).element_order(i)
+
+    def array(self):
+        if not hasattr(self, '_array'):
+            self._array = PermutationArray(self.l)
+        return self._array
+
+    def _table_rows(self, start, stop):
+        return self.array().rows(start, stop).astype(numpy.int32)
+
+    def row_source(self):
+        # The permutations as an int array of images, without the Permutation objects
+        return self.array().rows
+
+    def cayley(self):
+        self.table()
+        return super(PermutationGroup, self).cayley()
+
+    def centralizer(self, g):
+        if hasattr(self, '_table'):
+            return super(PermutationGroup, self).centralizer(g)
+        c = numpy.ones(len(self.l), dtype=bool)
+        p = self.array()
+        for j in g.l:
+            if j not in self.index():
+                return super(PermutationGroup, self).centralizer(g)
+            c &= p.commuting(self.index()[j])
+        return [self.l[i] for i in numpy.nonzero(c)[0]]
+
+    def _cosets(self, h, left):
+        idx = numpy.array([self.index().get(x, -1) for x in h.l], dtype=numpy.int64)
+        if (idx < 0).any():
+            return None
+        p = self.array()
+        return [h.l]+[[self.l[i] for i in c] for c in cosets(len(self.l), idx, p.left if left else p.right)[1:]]
+
+    def lcosets(self, h):
+        if hasattr(self, '_table') or not h<=self:
+            return super(PermutationGroup, self).lcosets(h)
+        return self._cosets(h, True) or super(PermutationGroup, self).lcosets(h)
+
+    def rcosets(self, h):
+        if hasattr(self, '_table') or not h<=self:
+            return super(PermutationGroup, self).rcosets(h)
+        return self._cosets(h, False) or super(PermutationGroup, self).rcosets(h)
 
 class MatrixGroup(FiniteGroup):
     def print_help():
@@ -369,14 +807,37 @@ class MatrixGroup(FiniteGroup):
         print('\t','?op = group operation')
         print('\t','?name = name of the group')
 
-    def __init__(self, l, op=getop('mult'), name=None):
+    def __init__(self, l, op=getop('mult'), name=None, e=None):
         p = None
-        if len(l)>0 and not isinstance(l[0], Matrix):
+        if l != None and len(l)>0 and not isinstance(l[0], Matrix):
             p = []
             for i in l:
                 p.append(Matrix(i))
-        e = None
-        super(MatrixGroup, self).__init__(p if p!= None else l, op, name=name)
+        super(MatrixGroup, self).__init__(p if p!= None else l, op, e, name=name)
+
+    def modulus(self):
+        # p when the operation is matrixmod p, else None
+        if getattr(self.op, 'type', None) == 'matrixmod':
+            return int(self.op.args[0])
+        return None
+
+    def array(self):
+        if not hasattr(self, '_array'):
+            self._array = MatrixArray(self.l, self.modulus())
+        return self._array
+
+    def _table_rows(self, start, stop):
+        p = self.modulus()
+        if p == None or not MatrixArray.fits(self.l, p):
+            return super(MatrixGroup, self)._table_rows(start, stop)
+        return self.array().rows(start, stop).astype(numpy.int32)
+
+    def row_source(self):
+        # The matrices as an int array of entries, when their products mod p are computed there
+        p = self.modulus()
+        if p == None or not MatrixArray.fits(self.l, p):
+            return super(MatrixGroup, self).row_source()
+        return self.array().rows
 
 class M(MatrixGroup):
     def print_help():
@@ -385,35 +846,100 @@ class M(MatrixGroup):
         print('\t','g = group or list of elements')
         print('\t','?op = group operation')
         print('\t','?name = name of the group')
+        print('\t','?lazy = 1 to stream the elements instead of storing them')
 
     def det_case(self, x):
         return True
 
-    def __init__(self, s, g, op=None, name=None):
-        s = int(s)
-        m = []
-        def loop_rec(g, n, l={}, rows=[]):
-            if n >= 1:
-                for a in g:
-                    l[n] = a
-                    rows = loop_rec(g, n - 1, l, rows)
-            else:
-                r = []
-                for i in l:
-                    r.append(l[i])
-                rows.append(r)
-            return rows
-        rows = loop_rec(g, s)
-        matrices = loop_rec(rows, s, {}, [])
-        for mat in matrices:
-            t = Matrix(mat)
-            if self.det_case(t):
-                m.append(t)
+    def __init__(self, s, g, op=None, name=None, lazy=False, e=None):
+        self.s = int(s)
+        self.entries = list(g)
+        m = None if int(lazy) else list(self.elements())
         if name == None:
-            name = 'M('+str(s)+', '+(format(g,'#') if isinstance(g, FiniteGroup) else str(g))+')'
+            name = 'M('+str(self.s)+', '+(format(g,'#') if isinstance(g, FiniteGroup) else str(g))+')'
         if op==None:
-            op = getop('mult', cache=len(m)**2)
-        super(M, self).__init__(m, op, name)
+            op = getop('mult', cache=len(m)**2) if m != None else getop('mult')
+        super(M, self).__init__(m, op, name, e)
+
+    def det_cases(self, stack):
+        return numpy.ones(len(stack), dtype=bool)
+
+    def elements(self):
+        s = self.s
+        if not all(isinstance(c, int) for c in self.entries):
+            for t in itertools.product(self.entries, repeat=s*s):
+                x = Matrix.from_flat(t, (s, s))
+                if self.det_case(x):
+                    yield x
+            return
+        for block in self._blocks():
+            for x in block.reshape(-1, s*s).tolist():
+                yield Matrix.from_flat(x, (s, s))
+
+    def _blocks(self):
+        # Integer entries are filtered a block of candidates at a time
+        s = self.s
+        candidates = itertools.product(self.entries, repeat=s*s)
+        while True:
+            block = numpy.array(list(itertools.islice(candidates, 1<<16)), dtype=numpy.int64).reshape(-1, s, s)
+            if len(block) == 0:
+                return
+            yield block[self.det_cases(block)]
+
+    def count(self):
+        return len(self.entries)**(self.s*self.s)
+
+    def enumerated_count(self):
+        # Every candidate is tested, but integer entries are only counted in blocks of
+        # determinants, without building a Matrix per element
+        if not all(isinstance(c, int) for c in self.entries):
+            return sum(1 for x in self.elements())
+        return sum(len(block) for block in self._blocks())
+
+    def __len__(self):
+        if self._l != None:
+            return len(self._l)
+        if not hasattr(self, '_len'):
+            self._len = self.count()
+        return self._len
+
+    def __contains__(self, x):
+        if not isinstance(x, Matrix) or x.rows()!=self.s or x.cols()!=self.s:
+            return False
+        return all(c in self.entries for c in x.t) and self.det_case(x)
+
+    @staticmethod
+    def prime_field(g, op):
+        # p when the entries are Z(p) for a prime p and op multiplies mod p, else None
+        l = list(g)
+        p = len(l)
+        if p < 2 or not all(isinstance(i, int) for i in l) or sorted(l) != list(range(p)):
+            return None
+        if any(p%d == 0 for d in range(2, int(p**0.5)+1)):
+            return None
+        return p if op == getop('matrixmod', p) else None
+
+    @staticmethod
+    def independent_rows(s, p, monic=False):
+        # Every list of s linearly independent rows over Z(p), extending one row at a time.
+        # With monic, the first row's leading nonzero entry is 1.
+        vectors = list(itertools.product(range(p), repeat=s))
+        def extend(rows, span):
+            if len(rows) == s:
+                yield rows
+                return
+            for v in vectors:
+                if v in span or (monic and not rows and next(c for c in v if c) != 1):
+                    continue
+                if len(rows)+1 < s:
+                    yield from extend(rows+[v], {tuple((a+c*b)%p for a, b in zip(w, v)) for w in span for c in range(p)})
+                else:
+                    yield rows+[v]
+        return extend([], {(0,)*s})
+
+    @staticmethod
+    def one(s):
+        return Matrix([[int(i==j) for j in range(s)] for i in range(s)])
 
 class GL(M):
     def print_help():
@@ -421,13 +947,37 @@ class GL(M):
         print('\t','s = square size of matrices')
         print('\t','g = group or list of elements')
         print('\t','?op = group operation')
+        print('\t','?lazy = 1 to stream the elements instead of storing them')
 
     def det_case(self, x):
+        if self.p:
+            return x.det()%self.p!=0
         return x.det()!=0
 
-    def __init__(self, s, g, op=None):
+    def det_cases(self, stack):
+        if self.p:
+            return det_mod(stack, self.p)!=0
+        return det_bareiss(stack)!=0
+
+    def count(self):
+        if self.p:
+            o = 1
+            for k in range(self.s):
+                o *= self.p**self.s-self.p**k
+            return o
+        # Outside a prime field membership is an integer determinant test, which has no closed
+        # form, so the count is an enumeration of all |entries|^(s^2) candidates
+        return self.enumerated_count()
+
+    def elements(self):
+        if not self.p:
+            return super(GL, self).elements()
+        return (Matrix.from_flat(sum(rows, ()), (self.s, self.s)) for rows in self.independent_rows(self.s, self.p))
+
+    def __init__(self, s, g, op=None, lazy=False):
         s = int(s)
-        super(GL, self).__init__(s, g, op, name='GL('+str(s)+', '+(format(g,'#') if isinstance(g, FiniteGroup) else str(g))+')')
+        self.p = self.prime_field(g, op)
+        super(GL, self).__init__(s, g, op, name='GL('+str(s)+', '+(format(g,'#') if isinstance(g, FiniteGroup) else str(g))+')', lazy=lazy, e=self.one(s) if self.p else None)
 
 class SL(M):
     def print_help():
@@ -435,13 +985,43 @@ class SL(M):
         print('\t','s = square size of matrices')
         print('\t','g = group or list of elements')
         print('\t','?op = group operation')
+        print('\t','?lazy = 1 to stream the elements instead of storing them')
 
     def det_case(self, x):
+        if self.p:
+            return x.det()%self.p==1
         return x.det()==1
 
-    def __init__(self, s, g, op=None):
+    def det_cases(self, stack):
+        if self.p:
+            return det_mod(stack, self.p)==1
+        return det_bareiss(stack)==1
+
+    def count(self):
+        if self.p:
+            o = 1
+            for k in range(self.s):
+                o *= self.p**self.s-self.p**k
+            return o//(self.p-1)
+        # An enumeration, as for GL
+        return self.enumerated_count()
+
+    def elements(self):
+        if not self.p:
+            return super(SL, self).elements()
+        return self._elements()
+
+    def _elements(self):
+        # Scaling the monic first row by det^-1 hits each determinant 1 matrix exactly once
+        p = self.p
+        for rows in self.independent_rows(self.s, p, monic=True):
+            d = pow(Matrix([list(r) for r in rows]).det()%p, p-2, p)
+            yield Matrix([[c*d%p for c in rows[0]]]+[list(r) for r in rows[1:]])
+
+    def __init__(self, s, g, op=None, lazy=False):
         s = int(s)
-        super(SL, self).__init__(s, g, op, name='SL('+str(s)+', '+(format(g,'#') if isinstance(g, FiniteGroup) else str(g))+')')
+        self.p = self.prime_field(g, op)
+        super(SL, self).__init__(s, g, op, name='SL('+str(s)+', '+(format(g,'#') if isinstance(g, FiniteGroup) else str(g))+')', lazy=lazy, e=self.one(s) if self.p else None)
 
 class Aff(MatrixGroup):
     def print_help():
@@ -463,43 +1043,91 @@ class S(PermutationGroup):
     def print_help():
         print('S arguments:')
         print('\t','n = group number')
+        print('\t','?lazy = 1 to stream the elements instead of storing them')
 
-    def __init__(self, n):
-        n = int(n)
-        if n>0 and n<=2:
+    def __init__(self, n, lazy=False):
+        self.n = int(n)
+        if self.n>0 and self.n<=2:
             self._abelian = True
         else:
             self._abelian = False
-        l = list(itertools.permutations(range(1,n+1)))
-        p = []
-        for s in l:
-            d = {}
-            for i in range(n):
-                d[i+1] = s[i]
-            p.append(d)
-        super(S, self).__init__(p, name='S('+str(n)+')')
+        super(S, self).__init__(None if int(lazy) else list(self.elements()), name='S('+str(self.n)+')')
+
+    def elements(self):
+        return (Permutation.from_images(s) for s in itertools.permutations(range(self.n)))
+
+    def __len__(self):
+        return factorial(self.n)
+
+    def __contains__(self, i):
+        return isinstance(i, Permutation) and i.degree()<=self.n
+
+    def conjugacy_classes(self):
+        # Conjugacy classes of S(n) are exactly the cycle types
+        if not hasattr(self, '_classes'):
+            classes = {}
+            for p in self:
+                classes.setdefault(p.cycle_type(), []).append(p)
+            self._classes = list(classes.values())
+        return self._classes
+
+    def class_sizes(self):
+        # n!/prod(k^m_k m_k!) for every partition of n, without touching the elements
+        def partitions(n, top):
+            if n == 0:
+                yield []
+            for k in range(min(n, top), 0, -1):
+                for rest in partitions(n-k, k):
+                    yield [k]+rest
+        sizes = []
+        for part in partitions(self.n, self.n):
+            d = 1
+            for k in set(part):
+                d *= k**part.count(k)*factorial(part.count(k))
+            sizes.append(factorial(self.n)//d)
+        return sorted(sizes)
 
 class A(PermutationGroup):
     def print_help():
         print('A arguments:')
         print('\t','n = group number')
+        print('\t','?lazy = 1 to stream the elements instead of storing them')
 
-    def __init__(self, n):
-        n = int(n)
-        if n>0 and n<=2:
+    def __init__(self, n, lazy=False):
+        self.n = int(n)
+        if self.n>0 and self.n<=2:
             self._abelian = True
         else:
             self._abelian = False
-        l = list(itertools.permutations(range(1,n+1)))
-        p = []
-        for s in l:
-            d = {}
-            for i in range(n):
-                d[i+1] = s[i]
-            perm = Permutation(d)
+        super(A, self).__init__(None if int(lazy) else list(self.elements()), name='A('+str(self.n)+')')
+
+    def elements(self):
+        for s in itertools.permutations(range(self.n)):
+            perm = Permutation.from_images(s)
             if perm.sign()>0:
-                p.append(perm)
-        super(A, self).__init__(p, name='A('+str(n)+')')
+                yield perm
+
+    def __len__(self):
+        return factorial(self.n)//2 if self.n>1 else 1
+
+    def __contains__(self, i):
+        return isinstance(i, Permutation) and i.degree()<=self.n and i.sign()>0
+
+    def conjugacy_classes(self):
+        # Cycle types, except that a type of distinct odd lengths splits in two
+        if not hasattr(self, '_classes'):
+            classes = {}
+            for p in self:
+                classes.setdefault(p.cycle_type(), []).append(p)
+            gens = [Permutation([1,2,k]) for k in range(3, self.n+1)]
+            self._classes = []
+            for t, c in classes.items():
+                lengths = list(t)+[1]*(self.n-sum(t))
+                if self.n > 1 and len(set(lengths)) == len(lengths) and all(k%2 for k in lengths):
+                    self._classes += self._generator_classes(gens, c)
+                else:
+                    self._classes.append(c)
+        return self._classes
 
 class D(PermutationGroup):
     def print_help():
@@ -531,10 +1159,7 @@ class D(PermutationGroup):
             self._abelian = False
             name+=['f'+str(i) for i in range(2,n)]+['g', 'gf']+['gf'+str(i) for i in range(2,n)]
         for s in range(len(l)):
-            d = {}
-            for i in range(n):
-                d[i+1] = l[s][i]
-            p.append(Permutation(d,name[s]))
+            p.append(Permutation.from_images(tuple(i-1 for i in l[s]), name[s]))
         super(D, self).__init__(p, p[0], name='D('+str(n)+')')
 
 class U(FiniteGroup):
@@ -545,8 +1170,18 @@ class U(FiniteGroup):
     def __init__(self, n):
         n = int(n)
         self._abelian = True
+        self.n = n
         super(U, self).__init__([i for i in range(n) if gcd(i,n)==1] if n!=1 else [1], getop('multmod', n, cache=0), 1 if n>0 else None, name='U('+str(n)+')')
 
+    def element_order(self, i):
+        # Successive powers as plain integers mod n
+        term = i
+        for k in range(1, self.n+1):
+            if term == self.e:
+                return k
+            term = term*i%self.n
+        return None
+
 class Z(FiniteGroup):
     def print_help():
         print('Z arguments:')
@@ -557,6 +1192,9 @@ class Z(FiniteGroup):
         self._abelian = True
         super(Z, self).__init__([i for i in range(n)], getop('addmod', n, cache=0), 0 if n>0 else None, name='Z('+str(n)+')')
 
+    def element_order(self, i):
+        return len(self.l)//gcd(i,len(self.l))
+
     def subgroup(self, k):
         if len(self.l)%k == 0:
             return GeneratorGroup(int(len(self.l)/k)%len(self.l), self.op)
@@ -573,8 +1211,11 @@ class Zx(FiniteGroup):
     def __init__(self, n):
         n = int(n)
         self._abelian = True
+        self.n = n
         super(Zx, self).__init__([i for i in range(1,n)], getop('multmod', n, cache=0), 1 if n>1 else None, name='Zx('+str(n)+')')
 
+    element_order = U.element_order
+
 class Dic(GeneratorGroup):
     def print_help():
         print('Dic arguments:')
@@ -583,13 +1224,10 @@ class Dic(GeneratorGroup):
     def __init__(self, n):
         n = int(n) if n!=None else -1
         m = []
-        if n == 0:
-            m = [Quaternion(r=-1.0)]
-        elif n == 1:
-            m = [Quaternion(i=1.0)]
+        if n in [0, 1]:
+            m = [Dicyclic(n, 0, 1)]
         elif n > 1:
-            a = Quaternion(r=cos(pi/n), i=sin(pi/n))
-            m = [a, Quaternion(j=1.0)]
+            m = [Dicyclic(n, 1, 0), Dicyclic(n, 0, 1)]
         if n >= 2:
             self._abelian = False
         else:
@@ -613,8 +1251,6 @@ class Q(Dic):
 
 
 if __name__ == '__main__':
-    print()
-
     def append_required_length(nmin,nmax):
         class AppendRequiredLength(argparse.Action):
             def __call__(self, parser, args, values, option_string=None):
@@ -645,14 +1281,41 @@ if __name__ == '__main__':
     parser.add_argument('-t', '--task', action="append", nargs="*",
                         help='The subtasks to perform, as space separated list.\
                             Default is \'-t cyclic orders abelian center cayley subgroups cache\'.\
-                            Possible tasks: cyclic, orders, abelian, center, centralizer{group}, lcosets{group}, rcosets{group}, cayley, subgroups, cache')
+                            Possible tasks: cyclic, orders, abelian, center, centralizer{group}, lcosets{group}, rcosets{group}, normal{group}, quotient{group}, cayley, classes, subgroups, cache')
     parser.add_argument('-n', '--notask', action="append", nargs="+",
                         help='The subtasks to skip, as space separated list. Ignored if --task is used.\
                             Default is \'-t cyclic orders abelian center cayley subgroups cache\', the --notask argument\
                             allows you to skip any of these default tasks.\
                             Possible tasks: cyclic, orders, abelian, center, cayley, subgroups, cache')
+    parser.add_argument('--table', action="store_true",
+                        help='Build an integer-indexed Cayley table once and answer the tasks from it.')
+    parser.add_argument('-w', '--workers', type=int, default=1, metavar='N',
+                        help='Run up to N of the given groups at once in worker processes, printing their output in order.')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                        help='Build the Cayley table with N worker processes and answer the tasks from it.')
+    parser.add_argument('--table-dir', metavar='dir',
+                        help='As --table, but keep each table in this directory as a memory-mapped .npy file, reused between runs.')
+    parser.add_argument('--report', metavar='file',
+                        help='Write a JSON report of per-phase wall and CPU times, op evaluations and cache hit rates.')
+    parser.add_argument('--trace-memory', action="store_true",
+                        help='Add peak memory, traced with tracemalloc, to the --report. Tracing slows every phase, so its times are not comparable to an untraced run.')
+    parser.add_argument('--profile', metavar='file',
+                        help='Dump cProfile stats for each group to this file (suffixed with the group number when there are several).')
+    parser.add_argument('--cache-dir', metavar='dir',
+                        help='Keep the computed invariants and Cayley tables of groups in this directory between runs. Groups are still constructed, and an entry is only used when their elements match it.')
+    parser.add_argument('--cache-size', type=float, default=1024, metavar='MB',
+                        help='Size limit of the --cache-dir directory, least recently used groups are evicted first. Default is 1024.')
+    parser.add_argument('--format', default='text', choices=['text']+list(WRITERS),
+                        help='Write the results as text (the default), one json document, json lines, csv rows, or .npy arrays of element indices.\
+                            Other than text, results are streamed as they are computed, the Cayley table a row at a time.')
+    parser.add_argument('-o', '--output', metavar='file',
+                        help='Write the output to this file instead of stdout. With --format npy, the directory to write the arrays to.')
 
     args = parser.parse_args()
+    if args.format == 'text':
+        print()
+    if args.format == 'npy' and not args.output:
+        parser.error('--format npy needs an --output directory')
 
     group_type_list = {'Zx':Zx, 'Z':Z, 'U':U, 'A':A, 'Q':Q, 'Dic':Dic, 'D':D, 'S':S, 'Aff':Aff, 'SL':SL, 'GL':GL, 'M':M,
                         'FiniteGroup':FiniteGroup, 'PermutationGeneratorGroup':PermutationGeneratorGroup,
@@ -682,6 +1345,19 @@ if __name__ == '__main__':
 
     def subgroup_task(g):
         print('\nsubgroups:')
+        lattice = g.subgroup_lattice()
+        if lattice != None:
+            subs, edges = lattice
+            for i, s in enumerate(subs):
+                if i == 0 or len(s) != len(subs[i-1]):
+                    print(len(s))
+                print('\t'+str(i)+':',s,flush=True)
+            print('lattice:')
+            for j in range(len(subs)):
+                below = [str(i) for i, k in edges if k == j]
+                if below:
+                    print('\t'+str(j),'>',', '.join(below),flush=True)
+            return
         for i in range(1,len(g)+1):
             subs = g.subgroups(i)
             if subs[0] != NullGroup():
@@ -689,13 +1365,61 @@ if __name__ == '__main__':
                 for s in subs:
                     print('\t:',s,flush=True)
 
+    def classes_task(g):
+        print('\nclasses:')
+        for c in g.conjugacy_classes():
+            print('\t:',c,flush=True)
+        print('\tclass equation:',g.class_equation(),flush=True)
+
     def cache_task(g):
         print('\ncache:')
         print('\tpower:',g.power.cache_info())
-        print('\torder:',g.power.cache_info())
+        print('\torder:',g.order.cache_info())
         print('\top:',g.op.cache_info())
 
-    task_list = ['cyclic', 'orders', 'abelian', 'center', 'centralizer', 'lcosets', 'rcosets', 'cayley', 'subgroups', 'cache']
+    def record_subgroups(w, g):
+        lattice = g.subgroup_lattice()
+        if lattice != None:
+            subs, edges = lattice
+            w.rows('subgroups', (s.l for s in subs))
+            w.rows('lattice', edges, elements=False)
+            return
+        def subgroups():
+            for i in range(1,len(g)+1):
+                subs = g.subgroups(i)
+                if subs[0] != NullGroup():
+                    for s in subs:
+                        yield s.l
+        w.rows('subgroups', subgroups())
+
+    def record_cosets(w, key, cosets):
+        if isinstance(cosets, str):
+            w.value(key, cosets)
+        else:
+            w.rows(key, cosets)
+
+    def record_classes(w, g):
+        w.rows('classes', g.conjugacy_classes())
+        w.value('class equation', g.class_equation())
+
+    # The tasks again for the structured --format writers, which stream rows instead of printing
+    record_dict = {
+        'cyclic':(lambda w, g: w.value('cyclic', g.cyclic(), elements=True)),
+        'orders':(lambda w, g: w.value('orders', g.orders(), elements=True)),
+        'abelian':(lambda w, g: w.value('abelian', g.abelian())),
+        'center':(lambda w, g: w.value('center', g.center(), elements=True)),
+        'centralizer':(lambda w, g, h: w.value('centralizer('+format(h,'#')+')', g.centralizer(h), elements=True)),
+        'lcosets':(lambda w, g, h: record_cosets(w, 'lcosets('+format(h,'#')+')', g.lcosets(h))),
+        'rcosets':(lambda w, g, h: record_cosets(w, 'rcosets('+format(h,'#')+')', g.rcosets(h))),
+        'normal':(lambda w, g, h: w.value('normal('+format(h,'#')+')', g.is_normal(h))),
+        'quotient':(lambda w, g, h: w.value('quotient('+format(h,'#')+')', g.quotient(h))),
+        'cayley':(lambda w, g: w.table('cayley', g.l, g.table_rows)),
+        'classes':record_classes,
+        'subgroups':record_subgroups,
+        'cache':(lambda w, g: w.value('cache', {'power': g.power.cache_info(), 'order': g.order.cache_info(), 'op': g.op.cache_info()})),
+    }
+
+    task_list = ['cyclic', 'orders', 'abelian', 'center', 'centralizer', 'lcosets', 'rcosets', 'normal', 'quotient', 'cayley', 'classes', 'subgroups', 'cache']
     default_task_list = ['cyclic', 'orders', 'abelian', 'center', 'cayley', 'subgroups', 'cache']
     task_dict = {
         'cyclic':(lambda g: print('\ncyclic:',g.cyclic(),flush=True)),
@@ -705,7 +1429,10 @@ if __name__ == '__main__':
         'centralizer':(lambda g, h: print('\ncentralizer('+format(h,'#')+'):',g.centralizer(h),flush=True)),
         'lcosets':(lambda g, h: print('\nlcosets('+format(h,'#')+'):',g.lcosets(h),flush=True)),
         'rcosets':(lambda g, h: print('\nrcosets('+format(h,'#')+'):',g.rcosets(h),flush=True)),
+        'normal':(lambda g, h: print('\nnormal('+format(h,'#')+'):',g.is_normal(h),flush=True)),
+        'quotient':(lambda g, h: print('\nquotient('+format(h,'#')+'):',g.quotient(h),flush=True)),
         'cayley':(lambda g: print('\ncayley:',g.cayley(),flush=True)),
+        'classes':classes_task,
         'subgroups':subgroup_task,
         'cache':cache_task,
     }
@@ -724,27 +1451,103 @@ if __name__ == '__main__':
         for t in default_task_list:
             tasks_to_perform.append([t])
 
-    def task(group, *args, **kwargs):
-        task_start = time.clock()
-        g = group(*args, **kwargs)
-        print('group:',format(g,'#'),'=',g)
-        print('\nlength:',len(g))
-        print('\nidentity:',g.identity(),flush=True)
-        if g.identity()!=None:
+    use_table = args.table
+    table_dir = args.table_dir
+    args_report = args.report
+    args_trace_memory = args.trace_memory
+    args_profile = args.profile
+    jobs = args.jobs
+    if table_dir:
+        os.makedirs(table_dir, exist_ok=True)
+    args_format = args.format
+    args_output = args.output
+    disk_cache = GroupCache(args.cache_dir, args.cache_size*(1<<20)) if args.cache_dir else None
+
+    def cached_state(g):
+        # The invariants a cached group holds, by name
+        return {k for k, v in g.__getstate__().items() if v is not None}
+
+    def task(group, *args, task_index=0, **kwargs):
+        task_start = time.perf_counter()
+        cpu_start = time.process_time()
+        profile = None
+        if args_profile:
+            profile = args_profile if len(groups) == 1 else args_profile+'.'+str(task_index)
+        inst = Instrument(args_trace_memory, profile)
+        inst.start()
+        stored = None
+        counts = evaluation_counts()
+        with inst.phase('construct'):
+            g = group(*args, **kwargs)
+            if disk_cache:
+                key = disk_cache.key(group, args, kwargs)
+                if disk_cache.load(key, g) is not None:
+                    stored = cached_state(g)
+        # Products made while constructing count too, an operation made by the constructor started at 0
+        evaluations = next((n for op, n in counts if op is g.op), 0)
+        counts = None
+        writer = None
+        if args_format != 'text':
+            writer = WRITERS[args_format](g, task_index, *([args_output] if args_format == 'npy' else []))
+            writer.value('length', len(g))
+        else:
+            print('group:',format(g,'#'),'=',g)
+            print('\nlength:',len(g))
+        with inst.phase('identity'):
+            e = g.identity()
+        if writer:
+            writer.value('identity', e)
+        else:
+            print('\nidentity:',e,flush=True)
+        if e!=None:
+            with inst.phase('table'):
+                if table_dir and not hasattr(g, '_table'):
+                    path = os.path.join(table_dir, re.sub('[^A-Za-z0-9]+', '_', format(g,'#')).strip('_')+'-'+group_key(group, args, kwargs)[:16])
+                    try:
+                        g.load_table(path, jobs=jobs)
+                    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                        # Not written yet, or left unusable by an older run: write it again
+                        g.save_table(path, jobs=jobs)
+                        g.load_table(path, jobs=jobs)
+                elif use_table or jobs > 1:
+                    g.table(jobs)
             for task in tasks_to_perform:
-                if len(task)>1:
-                    if ',' in task[1]:
-                        h = parse_group([''.join(task[1][:task[1].index(',')]), ''.join(task[1][task[1].index(',')+1:])])
-                        task_dict[task[0]](g, h[0](*h[1], **h[2]))
+                run = functools.partial(record_dict[task[0]], writer) if writer else task_dict[task[0]]
+                with inst.phase(task[0]+('{'+task[1]+'}' if len(task)>1 else '')):
+                    if len(task)>1:
+                        if ',' in task[1]:
+                            h = parse_group([''.join(task[1][:task[1].index(',')]), ''.join(task[1][task[1].index(',')+1:])])
+                            run(g, h[0](*h[1], **h[2]))
+                        else:
+                            h = parse_group([task[1],""])
+                            run(g, h[0](*h[1], **h[2]))
                     else:
-                        h = parse_group([task[1],""])
-                        task_dict[task[0]](g, h[0](*h[1], **h[2]))
-                else:
-                    task_dict[task[0]](g)
-        task_end = time.clock()
-        print('\ntask_time =',task_end - task_start,'s\n')
-        print('*****************************************\n',flush=True)
-        return task_end - task_start
+                        run(g)
+        if disk_cache:
+            with inst.phase('cache_save'):
+                if hasattr(g, '_cayley') and g._l != None:
+                    g.table()
+                # A hit is only written back when the tasks computed something it did not hold
+                if stored != cached_state(g):
+                    disk_cache.save(key, g)
+        report = inst.stop(g, (g.op.evaluations if g.op != None else 0) - evaluations)
+        task_time = time.perf_counter() - task_start
+        cpu_time = time.process_time() - cpu_start
+        if writer:
+            writer.end(task_time=task_time, cpu_time=cpu_time)
+            sys.stdout.flush()
+        else:
+            print('\ntask_time =',task_time,'s')
+            print('cpu_time =',cpu_time,'s\n')
+            print('*****************************************\n',flush=True)
+        return task_time, cpu_time, report
+
+    def buffered_task(i):
+        # Runs in a forked worker, which inherits the parsed groups and tasks
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            result = task(groups[i][0], *groups[i][1], task_index=i, **groups[i][2])
+        return out.getvalue(), result
 
     def parse_group(g):
         if g[0] not in group_type_list:
@@ -854,10 +1657,36 @@ if __name__ == '__main__':
         if new_group:
             groups.append(new_group)
 
-    print()
-    print('*****************************************\n',flush=True)
-    total_task_time = 0
-    for g in groups:
-        total_task_time += task(g[0], *g[1], **g[2])
-
-    print('\ntotal_time =',total_task_time,'s')
+    run_output = contextlib.ExitStack()
+    if args_output and args_format != 'npy':
+        run_output.enter_context(contextlib.redirect_stdout(run_output.enter_context(open(args_output, 'w'))))
+    if args_format != 'text':
+        WRITERS[args_format].start_run()
+    else:
+        print()
+        print('*****************************************\n',flush=True)
+    start = time.perf_counter()
+    total_cpu_time = 0
+    reports = []
+    if args.workers > 1 and len(groups) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        # Groups run concurrently, each one's output is held back and printed in order
+        with concurrent.futures.ProcessPoolExecutor(min(args.workers, len(groups)), mp_context=multiprocessing.get_context('fork')) as pool:
+            for out, result in pool.map(buffered_task, range(len(groups))):
+                print(out, end='', flush=True)
+                total_cpu_time += result[1]
+                reports.append(result[2])
+    else:
+        for i, g in enumerate(groups):
+            result = task(g[0], *g[1], task_index=i, **g[2])
+            total_cpu_time += result[1]
+            reports.append(result[2])
+    total_time = time.perf_counter() - start
+
+    if args_format != 'text':
+        WRITERS[args_format].end_run(total_time=total_time, total_cpu_time=total_cpu_time)
+    else:
+        print('\ntotal_time =',total_time,'s')
+        print('total_cpu_time =',total_cpu_time,'s')
+    run_output.close()
+    if args_report:
+        write_report(args_report, reports, total_time=total_time, total_cpu_time=total_cpu_time)
@@ -0,0 +1,65 @@
+import cProfile
+import contextlib
+import json
+import time
+import tracemalloc
+
+def cache_stats(info):
+    # hits, misses and hit rate from a cache_info() tuple, None for an uncached function
+    if not hasattr(info, 'hits'):
+        return None
+    stats = {'hits': info.hits, 'misses': info.misses, 'currsize': info.currsize,
+             'hit_rate': info.hits/(info.hits+info.misses) if info.hits+info.misses else None}
+    if hasattr(info, 'evictions'):
+        stats['evictions'] = info.evictions
+    return stats
+
+class Instrument:
+    # Wall and CPU time per phase of one group's run, with op, cache and memory figures.
+    # Memory tracing and profiling both slow the run, so they are only on when asked for.
+    def __init__(self, trace_memory=False, profile=None):
+        self.phases = []
+        self.trace_memory = trace_memory
+        self.profile_path = profile
+        self.profile = cProfile.Profile() if profile else None
+        self.report = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.phases.append({'phase': name, 'wall': time.perf_counter()-wall, 'cpu': time.process_time()-cpu})
+
+    def start(self):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if self.profile:
+            self.profile.enable()
+
+    def stop(self, g=None, evaluations=None):
+        if self.profile:
+            self.profile.disable()
+            self.profile.dump_stats(self.profile_path)
+            self.report['profile'] = self.profile_path
+        if self.trace_memory:
+            self.report['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        self.report['phases'] = self.phases
+        self.report['wall'] = sum(p['wall'] for p in self.phases)
+        self.report['cpu'] = sum(p['cpu'] for p in self.phases)
+        if g is not None:
+            self.report['group'] = format(g, '#')
+            self.report['length'] = len(g)
+            self.report['op_evaluations'] = evaluations
+            self.report['caches'] = {'power': cache_stats(g.power.cache_info()),
+                                     'order': cache_stats(g.order.cache_info()),
+                                     'op': cache_stats(g.op.cache_info()) if g.op != None else None}
+        return self.report
+
+def write_report(path, groups, **totals):
+    with open(path, 'w') as f:
+        json.dump(dict(totals, groups=groups), f, indent=2)
+        f.write('\n')
@@ -1,22 +1,109 @@
 import functools
-from numpy import matrix
+import operator
+import numpy
+
+from cayley import CodeIndex
+
+def det_bareiss(a):
+    # Exact integer determinants of an (N, s, s) stack by fraction-free elimination. Each step's
+    # products are of two minors, so int64 is kept only while twice the squared Hadamard bound
+    # fits; larger entries are eliminated as Python ints.
+    try:
+        a = numpy.array(a, dtype=numpy.int64)
+        m = max(int(a.max()), -int(a.min())) if a.size else 0
+        exact = 2*(a.shape[1]*m*m)**a.shape[1] >= 1<<63
+    except OverflowError:
+        exact = True
+    if exact:
+        a = numpy.array(a, dtype=object)
+    n, s = a.shape[0], a.shape[1]
+    r = numpy.arange(n)
+    sign = numpy.ones(n, dtype=a.dtype)
+    prev = numpy.ones(n, dtype=a.dtype)
+    dead = numpy.zeros(n, dtype=bool)
+    for k in range(s-1):
+        nz = a[:, k:, k] != 0
+        dead |= ~nz.any(axis=1)
+        piv = k+nz.argmax(axis=1)
+        sign[piv != k] *= -1
+        row = a[r, k].copy()
+        a[r, k] = a[r, piv]
+        a[r, piv] = row
+        pv = numpy.where(dead, 1, a[:, k, k])
+        a[:, k+1:, k+1:] = (a[:, k+1:, k+1:]*pv[:, None, None]-a[:, k+1:, k, None]*a[:, k, None, k+1:])//prev[:, None, None]
+        prev = pv
+    det = sign*a[:, s-1, s-1] if s else numpy.ones(n, dtype=a.dtype)
+    det[dead] = 0
+    return det
+
+def det_mod(a, p):
+    # Determinants mod a prime p of an (N, s, s) stack by Gaussian elimination mod p
+    a = numpy.array(a, dtype=numpy.int64)%p
+    n, s = a.shape[0], a.shape[1]
+    r = numpy.arange(n)
+    inv = numpy.array([pow(x, p-2, p) if x else 0 for x in range(p)], dtype=numpy.int64)
+    det = numpy.ones(n, dtype=numpy.int64)
+    for k in range(s):
+        nz = a[:, k:, k] != 0
+        det[~nz.any(axis=1)] = 0
+        piv = k+nz.argmax(axis=1)
+        det[piv != k] = -det[piv != k]%p
+        row = a[r, k].copy()
+        a[r, k] = a[r, piv]
+        a[r, piv] = row
+        det = det*a[:, k, k]%p
+        f = a[:, k+1:, k]*inv[a[:, k, k]][:, None]%p
+        a[:, k+1:, :] = (a[:, k+1:, :]-f[:, :, None]*a[:, k, None, :])%p
+    return det
+
+def mult_mod(a, b, p):
+    # Products mod p of stacks of matrices, broadcasting like numpy.matmul
+    return numpy.matmul(a, b)%p
 
 @functools.total_ordering
 class Matrix:
+    __slots__ = ('t', 'shape', '_hash', '_det')
+
+    @classmethod
+    def from_flat(cls, t, shape):
+        # t holds the entries row by row
+        x = cls.__new__(cls)
+        x.t = tuple(t)
+        x.shape = shape
+        x._hash = hash((shape, x.t))
+        return x
+
     def __init__(self, m):
-        if isinstance(m, matrix):
-            self.m = m
+        if isinstance(m, Matrix):
+            t, shape = m.t, m.shape
         else:
-            self.m = matrix(m)
+            rows = m.tolist() if isinstance(m, numpy.ndarray) else m
+            if len(rows)>0 and not isinstance(rows[0], (list, tuple)):
+                rows = [rows]
+            shape = (len(rows), len(rows[0]) if rows else 0)
+            t = tuple(c for r in rows for c in r)
+        self.t = t
+        self.shape = shape
+        self._hash = hash((shape, t))
 
     def rows(self):
-        return self.m.shape[0]
+        return self.shape[0]
 
     def cols(self):
-        return self.m.shape[1]
+        return self.shape[1]
+
+    def tolist(self):
+        c = self.cols()
+        return [list(self.t[r*c:(r+1)*c]) for r in range(self.rows())]
+
+    def array(self):
+        return numpy.array(self.tolist())
+
+    def integer(self):
+        return all(isinstance(c, (int, numpy.integer)) and not isinstance(c, bool) for c in self.t)
 
     def cut(self, r, c):
-        l = self.m.tolist()
+        l = self.tolist()
         m = []
         for i in range(self.rows()):
             if i != r:
@@ -32,56 +119,111 @@ class Matrix:
             if self.rows()!=self.cols():
                 return None
             if self.rows()==1:
-                return self.m.tolist()[0][0]
+                return self.t[0]
+            if self.integer():
+                self._det = int(det_bareiss(self.array()[None])[0])
+                return self._det
             self._det = 0
             for c in range(self.cols()):
-                self._det += ((-1)**(c%2)) * self.m.tolist()[0][c] * self.cut(0, c).det()
+                self._det += ((-1)**(c%2)) * self.t[c] * self.cut(0, c).det()
         return self._det
 
     def __format__(self, format_spec):
-        return '['+', '.join(['['+', '.join([format(c, format_spec) for c in r])+']' for r in self.m.tolist()])+']'
+        return '['+', '.join(['['+', '.join([format(c, format_spec) for c in r])+']' for r in self.tolist()])+']'
 
     def __str__(self):
-        return str(self.m.tolist())
+        return str(self.tolist())
 
     __repr__ = __str__
 
+    def identity(self):
+        # The identity of matrix multiplication, for square matrices only
+        n, m = self.shape
+        if n != m:
+            return None
+        return Matrix.from_flat([int(i%(n+1) == 0) for i in range(n*n)], self.shape)
+
     def __hash__(self):
-        if not hasattr(self, '_hash'):
-            l = self.m.tolist()
-            s = []
-            for i in l:
-                for e in range(len(i)):
-                    s.append((e+1)*hash(frozenset(i))*hash(i[e]))
-            self._hash = hash(frozenset(s))
         return self._hash
 
     def __mul__(self, other):
         if isinstance(other, Matrix):
-            return Matrix(self.m*other.m)
-        return Matrix([[c*other for c in r] for r in self.m.tolist()])
+            n, k = self.shape
+            m = other.cols()
+            a, b = self.t, other.t
+            cols = [b[j::m] for j in range(m)]
+            return Matrix.from_flat([sum(map(operator.mul, a[i*k:(i+1)*k], col)) for i in range(n) for col in cols], (n, m))
+        return Matrix.from_flat([c*other for c in self.t], self.shape)
 
     __rmul__ = __mul__
 
     def __add__(self, other):
         if isinstance(other, Matrix):
-            return Matrix(self.m+other.m)
-        return Matrix([[c+other for c in r] for r in self.m.tolist()])
+            return Matrix.from_flat(map(operator.add, self.t, other.t), self.shape)
+        return Matrix.from_flat([c+other for c in self.t], self.shape)
 
     __radd__ = __add__
 
     def __eq__(self, other):
         if not isinstance(other, Matrix):
             return False
-        if self.rows()!=other.rows() or self.cols()!=other.cols():
-            return False
-        s_m = self.m.tolist()
-        o_m = other.m.tolist()
-        for r in range(self.rows()):
-            for c in range(self.cols()):
-                if s_m[r][c] != o_m[r][c]:
-                    return False
-        return True
+        return self.shape == other.shape and self.t == other.t
 
     def __lt__(self, other):
         return hash(self) < hash(other)
+
+class MatrixArray:
+    def __init__(self, matrices, p):
+        self.matrices = list(matrices)
+        self.p = p
+        self.a = numpy.array([m.t for m in self.matrices], dtype=numpy.int64).reshape((len(self.matrices),)+self.matrices[0].shape)
+        self._init_index()
+
+    def _init_index(self):
+        p = self.p
+        self.s = self.a.shape[1:]
+        self.radix = p**numpy.arange(self.s[0]*self.s[1], dtype=numpy.int64)
+        codes = self.codes(self.a)
+        # Unreduced entries never equal a product mod p
+        codes[~((self.a >= 0) & (self.a < p)).all(axis=(1, 2))] = -1
+        self.index = CodeIndex(codes, p**len(self.radix))
+
+    @staticmethod
+    def fits(matrices, p):
+        # Integer matrices of one shape whose entries mod p fit an int64 code
+        shapes = set(m.shape for m in matrices)
+        if len(shapes) != 1 or not all(m.integer() for m in matrices):
+            return False
+        r, c = shapes.pop()
+        return r == c and p**(r*c) < 2**63
+
+    def __getstate__(self):
+        # Only the entries, in the smallest type holding them, go to other processes; the Matrix
+        # objects and index stay behind
+        dtype = numpy.result_type(numpy.min_scalar_type(self.a.min()), numpy.min_scalar_type(self.a.max()))
+        return {'p': self.p, 'a': self.a.astype(dtype)}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.a = self.a.astype(numpy.int64)
+        self.matrices = None
+        self._init_index()
+
+    def __len__(self):
+        return len(self.a)
+
+    def codes(self, stack):
+        return stack.reshape(len(stack), -1)@self.radix
+
+    def find(self, stack):
+        return self.index.find(self.codes(stack))
+
+    def rows(self, start, stop, chunk=1<<22):
+        # Cayley table rows [start, stop), one batched product mod p per block of rows
+        out = numpy.empty((stop-start, len(self.a)), dtype=numpy.int64)
+        step = max(1, chunk//max(1, len(self.a)*self.s[0]*self.s[1]))
+        for i in range(start, stop, step):
+            j = min(stop, i+step)
+            products = mult_mod(self.a[i:j, None], self.a[None], self.p)
+            out[i-start:j-start] = self.find(products.reshape((-1,)+self.s)).reshape(j-i, -1)
+        return out
@@ -1,21 +1,114 @@
+import collections
 import functools
+import sys
+import weakref
 
 from matrix import *
 from permutation import *
 
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize', 'evictions', 'nbytes'])
+
+class OperationCache:
+    # Least recently used products, bounded by a number of entries and optionally by bytes.
+    # Sizes are the shallow sys.getsizeof of key and result, so the byte bound is approximate,
+    # and they are only tracked when there is a byte bound.
+    def __init__(self, maxsize=128, maxbytes=None):
+        self.maxsize = int(maxsize)
+        self.maxbytes = int(maxbytes) if maxbytes != None else None
+        self.data = collections.OrderedDict()
+        self.hits = self.misses = self.evictions = self.nbytes = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        entry = self.data.get(key)
+        if entry == None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        data = self.data
+        if self.maxbytes == None:
+            data[key] = (value, 0)
+            if len(data) > self.maxsize:
+                data.popitem(last=False)
+                self.evictions += 1
+            return
+        size = sys.getsizeof(key)+sys.getsizeof(value)
+        old = data.pop(key, None)
+        if old != None:
+            self.nbytes -= old[1]
+        data[key] = (value, size)
+        self.nbytes += size
+        while data and (len(data) > self.maxsize or self.nbytes > self.maxbytes):
+            _, (_, s) = data.popitem(last=False)
+            self.nbytes -= s
+            self.evictions += 1
+
+    def clear(self):
+        self.data.clear()
+        self.nbytes = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.data), self.evictions, self.nbytes)
+
+# Every operation still in use, by id, so evaluation counts can be taken before a group makes its own
+live = weakref.WeakValueDictionary()
+
+def evaluation_counts():
+    # Each live operation with its count; holding the operations keeps their ids from being reused
+    return [(op, op.evaluations) for op in list(live.values())]
+
 class Operation:
-    def __init__(self, op, name, cache=128):
+    def __init__(self, op, name, cache=128, cache_bytes=None, keyed=False):
+        live[id(self)] = self
         self.op = op
         self.name = name
         self.cache = int(cache)
-        if self.cache!=0:
-            @functools.lru_cache(self.cache)
-            def _call(*args):
-                return self.op(*args)
-        else:
-            def _call(*args):
-                return self.op(*args)
-        self.call = _call
+        self.cache_bytes = int(cache_bytes) if cache_bytes != None else None
+        self.keyed = bool(int(keyed))
+        self._ids = None
+        self.evaluations = 0
+        self.store = OperationCache(self.cache, cache_bytes) if self.cache!=0 else None
+
+    def index(self, l):
+        # Key products of elements of l by their positions, skipping the elements' own hashing;
+        # l is kept so the ids stay valid, and int keys from an earlier list are dropped
+        if self._ids != None and self._l is l:
+            return
+        if self._ids != None and self.store != None:
+            self.store.clear()
+        self._l = l
+        self._ids = {id(x): i for i, x in enumerate(l)}
+
+    def key(self, args):
+        if self._ids != None and len(args) == 2:
+            i, j = self._ids.get(id(args[0])), self._ids.get(id(args[1]))
+            if i != None and j != None:
+                # A single int never equals an argument tuple
+                return i*len(self._l)+j
+        return args
+
+    def call(self, *args):
+        store = self.store
+        if store == None:
+            self.evaluations += 1
+            return self.op(*args)
+        key = self.key(args) if self._ids != None else args
+        entry = store.data.get(key)
+        if entry != None:
+            store.hits += 1
+            store.data.move_to_end(key)
+            return entry[0]
+        store.misses += 1
+        self.evaluations += 1
+        res = self.op(*args)
+        store.put(key, res)
+        return res
 
     def __str__(self):
         return self.name
@@ -30,29 +123,44 @@ class Operation:
     def __call__(self, *args):
         return self.call(*args)
 
+    def __reduce__(self):
+        # The operation and its cache are closures, so rebuild it through getop
+        return (functools.partial(getop, self.type, cache=self.cache, cache_bytes=self.cache_bytes, keyed=self.keyed), self.args)
+
     def cache_info(self):
-        if self.cache!=0:
-            return self.call.cache_info()
+        if self.store != None:
+            return self.store.info()
         else:
             return 'None'
 
-ops = { 'add':(lambda *args: Operation(lambda x,y: x+y, 'add', *args),{}),
-        'mult':(lambda *args: Operation(lambda x,y: x*y, 'mult', *args),{}),
-        'matrixmod':(lambda mod,*args: Operation(lambda x,y: Matrix([[c%int(mod) for c in r] for r in (x*y).m.tolist()]), 'matrixmod'+str(mod), *args),{}),
-        'matrixelement':(lambda eop,*args: Operation(lambda x,y: Matrix([[eop(x.m.tolist()[r][c],y.m.tolist()[r][c]) for c in range(len(x.m.tolist()[r]))] for r in range(len(x.m.tolist()))]), 'matrixelement'+str(eop), *args),{}),
-        'addmod':(lambda mod,*args: Operation(lambda x,y: (x+y)%int(mod), 'addmod'+str(mod), *args),{}),
-        'multmod':(lambda mod,*args: Operation(lambda x,y: (x*y)%int(mod), 'multmod'+str(mod), *args),{})}
+    def cache_clear(self):
+        if self.store != None:
+            self.store.clear()
+
+ops = { 'add':(lambda *args, **kwargs: Operation(lambda x,y: x+y, 'add', *args, **kwargs),{}),
+        'mult':(lambda *args, **kwargs: Operation(lambda x,y: x*y, 'mult', *args, **kwargs),{}),
+        'matrixmod':(lambda mod,*args, **kwargs: Operation(lambda x,y: (lambda p: Matrix.from_flat([c%int(mod) for c in p.t], p.shape))(x*y), 'matrixmod'+str(mod), *args, **kwargs),{}),
+        'matrixelement':(lambda eop,*args, **kwargs: Operation(lambda x,y: Matrix.from_flat(map(eop, x.t, y.t), x.shape), 'matrixelement'+str(eop), *args, **kwargs),{}),
+        'addmod':(lambda mod,*args, **kwargs: Operation(lambda x,y: (x+y)%int(mod), 'addmod'+str(mod), *args, **kwargs),{}),
+        'multmod':(lambda mod,*args, **kwargs: Operation(lambda x,y: (x*y)%int(mod), 'multmod'+str(mod), *args, **kwargs),{}),
+        'table':(lambda l,t,name,*args, **kwargs: (lambda index: Operation(lambda x,y: l[t[index[x]][index[y]]], 'table'+str(name), *args, **kwargs))({x: i for i, x in enumerate(l)}),{})}
 
 def getop(type, *args, **kwargs):
+    # Operations made with the same id share one instance, and so one cache, for the life of the
+    # process
     op = None
     if type in ops:
         if 'id' in kwargs:
-            if kwargs['id'] in ops[type][1]:
-                return ops[type][1][kwargs['id']]
+            op = ops[type][1].get(kwargs['id'])
+            if op != None:
+                return op
+        options = {k: kwargs[k] for k in ('cache_bytes', 'keyed') if k in kwargs}
         if 'cache' in kwargs:
-            op = ops[type][0](*args, kwargs['cache'])
+            op = ops[type][0](*args, kwargs['cache'], **options)
         else:
-            op = ops[type][0](*args)
+            op = ops[type][0](*args, **options)
+        op.type = type
+        op.args = args
         if 'id' in kwargs:
             ops[type][1][kwargs['id']] = op
     return op
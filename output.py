@@ -0,0 +1,282 @@
+import abc
+import csv
+import json
+import os
+import pickle
+import re
+import sys
+import numpy
+
+from cayley import write_table
+
+def encode(x):
+    # A result as JSON values: numbers and strings stay, containers recurse, elements are their str
+    if x is None or isinstance(x, (bool, int, float, str)):
+        return x
+    if isinstance(x, numpy.integer):
+        return int(x)
+    if hasattr(x, '_asdict'):
+        return {k: encode(v) for k, v in x._asdict().items()}
+    if isinstance(x, dict):
+        return {str(encode(k)): encode(v) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [encode(i) for i in x]
+    return str(x)
+
+def cell(x):
+    # A csv field, with containers as their JSON
+    x = encode(x)
+    return json.dumps(x) if isinstance(x, (list, dict)) else x
+
+class Writer(abc.ABC):
+    # One group's results, written as each task produces them. Everything goes to sys.stdout as it
+    # is at the time of writing, so the CLI's --output and -w redirections apply.
+    # Element results are flagged with elements=True, for formats that store them as indices.
+    def __init__(self, g, index=0):
+        self.g = g
+        self.name = format(g, '#')
+        self.index = index
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @classmethod
+    def start_run(cls):
+        pass
+
+    @classmethod
+    def end_run(cls, **totals):
+        pass
+
+    @abc.abstractmethod
+    def value(self, key, v, elements=False):
+        pass
+
+    @abc.abstractmethod
+    def rows(self, key, rows, elements=True):
+        pass
+
+    @abc.abstractmethod
+    def table(self, key, elements, rows, block=1024):
+        # rows(start, stop) gives integer rows into elements, -1 where a product leaves them
+        pass
+
+    def end(self, **fields):
+        pass
+
+def blocks(n, rows, block):
+    for start in range(0, n, block):
+        yield rows(start, min(n, start+block))
+
+class JsonWriter(Writer):
+    # A single JSON document, {"groups": [...], totals}, written a row at a time
+    def __init__(self, g, index=0):
+        super(JsonWriter, self).__init__(g, index)
+        self.stream.write((',\n' if index else '')+'{"group": '+json.dumps(self.name))
+
+    @classmethod
+    def start_run(cls):
+        sys.stdout.write('{"groups": [\n')
+
+    @classmethod
+    def end_run(cls, **totals):
+        sys.stdout.write('\n]'+''.join(', '+json.dumps(k)+': '+json.dumps(encode(v)) for k, v in totals.items())+'}\n')
+
+    def value(self, key, v, elements=False):
+        self.stream.write(', '+json.dumps(key)+': '+json.dumps(encode(v)))
+
+    def rows(self, key, rows, elements=True):
+        out = self.stream
+        out.write(', '+json.dumps(key)+': [')
+        for k, r in enumerate(rows):
+            out.write((',\n  ' if k else '\n  ')+json.dumps(encode(r)))
+        out.write('\n]')
+
+    def table(self, key, elements, rows, block=1024):
+        out = self.stream
+        names = [json.dumps(encode(x)) for x in elements]+['null']
+        out.write(', '+json.dumps(key)+': {"elements": ['+', '.join(names[:-1])+'], "rows": [')
+        first = True
+        for r in blocks(len(elements), rows, block):
+            for row in r.tolist():
+                out.write((',\n  [' if not first else '\n  [')+', '.join([names[k] for k in row])+']')
+                first = False
+        out.write('\n]}')
+
+    def end(self, **fields):
+        self.stream.write(''.join(', '+json.dumps(k)+': '+json.dumps(encode(v)) for k, v in fields.items())+'}')
+
+class JsonlWriter(Writer):
+    # One JSON object per line: a value, a row of a table, or a coset, class or subgroup
+    def line(self, **fields):
+        self.stream.write(json.dumps(dict(group=self.name, **fields))+'\n')
+
+    @classmethod
+    def end_run(cls, **totals):
+        sys.stdout.write(json.dumps({k: encode(v) for k, v in totals.items()})+'\n')
+
+    def value(self, key, v, elements=False):
+        self.line(task=key, value=encode(v))
+
+    def rows(self, key, rows, elements=True):
+        for k, r in enumerate(rows):
+            self.line(task=key, index=k, value=encode(r))
+
+    def table(self, key, elements, rows, block=1024):
+        names = [json.dumps(encode(x)) for x in elements]+['null']
+        prefix = '{"group": '+json.dumps(self.name)+', "task": '+json.dumps(key)+', "element": '
+        i = 0
+        for r in blocks(len(elements), rows, block):
+            for row in r.tolist():
+                self.stream.write(prefix+names[i]+', "value": ['+', '.join([names[k] for k in row])+']}\n')
+                i += 1
+
+    def end(self, **fields):
+        self.line(**{k: encode(v) for k, v in fields.items()})
+
+class CsvWriter(Writer):
+    # group, task, key, then the values spread over the remaining columns
+    @property
+    def out(self):
+        return csv.writer(self.stream, lineterminator='\n')
+
+    @classmethod
+    def start_run(cls):
+        csv.writer(sys.stdout, lineterminator='\n').writerow(['group', 'task', 'key', 'values'])
+
+    @classmethod
+    def end_run(cls, **totals):
+        csv.writer(sys.stdout, lineterminator='\n').writerows([['', k, '', v] for k, v in totals.items()])
+
+    def value(self, key, v, elements=False):
+        if hasattr(v, '_asdict'):
+            v = v._asdict()
+        if isinstance(v, dict):
+            self.out.writerows([[self.name, key, k, cell(i)] for k, i in v.items()])
+        elif isinstance(v, (list, tuple)):
+            self.out.writerow([self.name, key, '']+[cell(i) for i in v])
+        else:
+            self.out.writerow([self.name, key, '', cell(v)])
+
+    def rows(self, key, rows, elements=True):
+        out = self.out
+        for k, r in enumerate(rows):
+            out.writerow([self.name, key, k]+[cell(i) for i in r])
+
+    def table(self, key, elements, rows, block=1024):
+        out = self.out
+        names = [str(encode(x)) for x in elements]+['']
+        out.writerow([self.name, key, '']+names[:-1])
+        i = 0
+        for r in blocks(len(elements), rows, block):
+            out.writerows([[self.name, key, names[i+k]]+[names[j] for j in row] for k, row in enumerate(r.tolist())])
+            i += len(r)
+
+    def end(self, **fields):
+        self.out.writerows([[self.name, k, '', v] for k, v in fields.items()])
+
+class NpyWriter(JsonlWriter):
+    # Element results as .npy arrays of indices into the group's elements, pickled alongside as
+    # <prefix>.elements; ragged rows are a flat array with a -offsets.npy of row starts. The
+    # files written, and any result that is not an array, are listed as JSON lines.
+    def __init__(self, g, index=0, directory='.'):
+        super(NpyWriter, self).__init__(g, index)
+        os.makedirs(directory, exist_ok=True)
+        self.prefix = os.path.join(directory, str(index)+'-'+re.sub('[^A-Za-z0-9]+', '_', self.name).strip('_'))
+
+    def path(self, key):
+        return self.prefix+'-'+re.sub('[^A-Za-z0-9]+', '_', key).strip('_')
+
+    def indices(self, l):
+        index = self.g.index()
+        try:
+            idx = [index.get(x) for x in l]
+        except TypeError:
+            return None
+        if None in idx:
+            return None
+        if not hasattr(self, '_elements'):
+            self._elements = self.prefix+'.elements'
+            with open(self._elements, 'wb') as f:
+                pickle.dump(list(self.g.l), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return numpy.array(idx, dtype=numpy.int64)
+
+    def value(self, key, v, elements=False):
+        if elements and isinstance(v, tuple) and len(v) == 2 and isinstance(v[0], bool):
+            # cyclic() gives (is cyclic, generators)
+            idx = self.indices(v[1])
+            if idx is not None:
+                super(NpyWriter, self).value(key, v[0])
+                return self.save(key+' generators', idx)
+        elif elements and isinstance(v, dict):
+            idx = self.indices(list(v))
+            if idx is not None:
+                a = numpy.full(len(self.g), -1, dtype=numpy.int64)
+                a[idx] = [-1 if i == None else i for i in v.values()]
+                return self.save(key, a)
+        elif elements and isinstance(v, (list, tuple)):
+            idx = self.indices(v)
+            if idx is not None:
+                return self.save(key, idx)
+        super(NpyWriter, self).value(key, v)
+
+    def save(self, key, a):
+        path = self.path(key)+'.npy'
+        numpy.save(path, a)
+        self.line(task=key, file=path, elements=self._elements)
+
+    def rows(self, key, rows, elements=True):
+        # Indices are appended to raw files a row at a time and copied into .npy arrays once their
+        # lengths are known. A row that is not all elements turns the rest into JSON lines.
+        path = self.path(key)
+        rows = iter(rows)
+        stopped = None
+        with open(path+'.tmp', 'wb') as flat, open(path+'-offsets.tmp', 'wb') as offsets:
+            end = 0
+            offsets.write(numpy.int64(0).tobytes())
+            for k, r in enumerate(rows):
+                idx = self.indices(r) if elements else numpy.asarray(r, dtype=numpy.int64).ravel()
+                if idx is None:
+                    stopped = (k, r)
+                    break
+                flat.write(idx.tobytes())
+                end += len(idx)
+                offsets.write(numpy.int64(end).tobytes())
+        if stopped != None:
+            done = numpy.fromfile(path+'.tmp', dtype=numpy.int64)
+            ends = numpy.fromfile(path+'-offsets.tmp', dtype=numpy.int64)
+            os.remove(path+'.tmp')
+            os.remove(path+'-offsets.tmp')
+            for i in range(len(ends)-1):
+                self.line(task=key, index=i, value=encode([self.g.l[j] for j in done[ends[i]:ends[i+1]]]))
+            k, r = stopped
+            self.line(task=key, index=k, value=encode(r))
+            for k, r in enumerate(rows, k+1):
+                self.line(task=key, index=k, value=encode(r))
+            return
+        npy(path+'.tmp', path+'.npy')
+        npy(path+'-offsets.tmp', path+'-offsets.npy')
+        fields = {'elements': self._elements} if elements and hasattr(self, '_elements') else {}
+        self.line(task=key, file=path+'.npy', offsets=path+'-offsets.npy', **fields)
+
+    def table(self, key, elements, rows, block=1024):
+        # The same layout as --table-dir, so CayleyTable.load reads it back
+        path = self.path(key)
+        write_table(path, elements, rows, block)
+        self.line(task=key, file=path+'.npy', elements=path+'.elements')
+
+def npy(raw, path, block=1<<20):
+    # The int64 values in the file raw as the .npy array path, copied a block at a time
+    n = os.path.getsize(raw)//8
+    out = numpy.lib.format.open_memmap(path, mode='w+', dtype=numpy.int64, shape=(n,))
+    if n:
+        a = numpy.memmap(raw, dtype=numpy.int64, mode='r')
+        for start in range(0, n, block):
+            out[start:start+block] = a[start:start+block]
+        del a
+    out.flush()
+    del out
+    os.remove(raw)
+
+WRITERS = {'json': JsonWriter, 'jsonl': JsonlWriter, 'csv': CsvWriter, 'npy': NpyWriter}
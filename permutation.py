@@ -1,62 +1,134 @@
 import functools
+import numpy
+from math import gcd
+
+from cayley import CodeIndex
 
 @functools.total_ordering
 class Permutation:
+    __slots__ = ('a', 'name', '_str', '_hash', '_order', '_factors')
+
+    @classmethod
+    def canonical(cls, a):
+        # Drop trailing fixed points so equal permutations share one image tuple
+        n = len(a)
+        while n and a[n-1] == n-1:
+            n -= 1
+        return tuple(a[:n]) if n != len(a) or not isinstance(a, tuple) else a
+
+    @classmethod
+    def from_images(cls, a, name=None):
+        # a[i] is the (0-based) image of point i+1
+        p = cls.__new__(cls)
+        p.a = cls.canonical(a)
+        p.name = name
+        return p
+
     def __init__(self, l, name=None):
+        d = {}
         if isinstance(l, dict):
-            d = {}
-            for i in l:
-                if i != l[i]:
-                    d[i] = l[i]
-            self.d = d
+            d = l
         elif len(l)>0 and isinstance(l[0],list):
-            self.d = {}
             for j in l:
-                last = None
-                first = None
-                for i in j:
-                    if first==None:
-                        first = i
-                    if last!=None and last != i:
-                        self.d[last] = i
-                    last = i
-                if first != None and first != last:
-                    self.d[last] = first
+                for i, k in zip(j, j[1:]+j[:1]):
+                    if i != k:
+                        d[i] = k
         else:
-            self.d = {}
-            last = None
-            first = None
-            for i in l:
-                if first==None:
-                    first = i
-                if last!=None and last != i:
-                    self.d[last] = i
-                last = i
-            if first != None and first != last:
-                self.d[last] = first
+            for i, k in zip(l, list(l[1:])+list(l[:1])):
+                if i != k:
+                    d[i] = k
+        a = list(range(max(d) if d else 0))
+        for i in d:
+            a[i-1] = d[i]-1
+        self.a = self.canonical(a)
         self.name = name
+        order = tuple(i for i in d if d[i] != i)
+        if order != self.moved():
+            self._order = order
+
+    def __getstate__(self):
+        # The print order is settled first, so the factors of a product are not pickled with it
+        return (self.a, self.name, self.point_order())
+
+    def __setstate__(self, state):
+        self.a, self.name, order = state
+        if order != self.moved():
+            self._order = order
+
+    def moved(self):
+        return tuple(i+1 for i, j in enumerate(self.a) if i != j)
+
+    def point_order(self):
+        # The moved points in the order printing visits them, as the original dict-backed
+        # permutation kept them: as given when constructed, and for a product the right factor's
+        # points then the left's. Products only keep their factors until this is asked for
+        stack = [self]
+        while stack:
+            p = stack[-1]
+            factors = getattr(p, '_factors', None)
+            if factors == None:
+                stack.pop()
+                continue
+            pending = [q for q in factors if getattr(q, '_factors', None) != None]
+            if pending:
+                stack.extend(pending)
+                continue
+            s, o = factors
+            right = getattr(o, '_order', None) or o.moved()
+            left = getattr(s, '_order', None) or s.moved()
+            order = tuple([i for i in right if p[i] != i]+[i for i in left if o[i] == i])
+            p._factors = None
+            if order != p.moved():
+                p._order = order
+            stack.pop()
+        return getattr(self, '_order', None) or self.moved()
+
+    @property
+    def d(self):
+        return {i+1: j+1 for i, j in enumerate(self.a) if i != j}
+
+    def degree(self):
+        return len(self.a)
+
+    def cycles(self):
+        checked = [False]*len(self.a)
+        cycles = []
+        for i, j in enumerate(self.a):
+            if checked[i] or i == j:
+                continue
+            cycle = []
+            while not checked[i]:
+                checked[i] = True
+                cycle.append(i+1)
+                i = self.a[i]
+            cycles.append(cycle)
+        return cycles
 
     def __format__(self, format_spec):
         if format_spec == '#' and self.name!=None:
             return self.name
         return str(self)
 
+    def ordered_cycles(self):
+        # cycles(), each started at and listed by its first point in point_order()
+        checked = set()
+        cycles = []
+        for i in self.point_order():
+            if i in checked:
+                continue
+            cycle = []
+            while i not in checked:
+                checked.add(i)
+                cycle.append(i)
+                i = self[i]
+            cycles.append(cycle)
+        return cycles
+
     def __str__(self):
         if not hasattr(self, '_str'):
-            self._str = ""
-            if len(self.d) == 0:
+            self._str = ''.join('('+' '.join([str(s) for s in cycle])+')' for cycle in self.ordered_cycles())
+            if not self._str:
                 self._str = "()"
-            checked = []
-            for i in self.d:
-                if i in checked:
-                    continue
-                cur = i
-                cycle = []
-                while cur not in checked:
-                    checked.append(cur)
-                    cycle.append(cur)
-                    cur = self.d[cur]
-                self._str+=('('+' '.join([str(s) for s in cycle])+')')
             if self.name!=None:
                 self._str = self.name+'='+self._str
         return self._str
@@ -65,13 +137,13 @@ class Permutation:
 
     def __hash__(self):
         if not hasattr(self, '_hash'):
-            self._hash = hash(frozenset(self.d.items()))
+            self._hash = hash(self.a)
         return self._hash
 
     def __eq__(self, other):
         if not isinstance(other, Permutation):
             return False
-        return self.d == other.d
+        return self.a == other.a
 
     def __lt__(self, other):
         if not isinstance(other, Permutation):
@@ -79,25 +151,22 @@ class Permutation:
         return hash(self) < hash(other)
 
     def __getitem__(self, i):
-        if i in self.d:
-            return self.d[i]
+        if 0 < i <= len(self.a):
+            return self.a[i-1]+1
         return i
 
     def __mul__(self, other):
-        d = {}
         if isinstance(other, Permutation):
-            for i in other.d:
-                nxt = self[other[i]]
-                if nxt != i:
-                    d[i] = nxt
-            for i in self.d:
-                if i not in other.d:
-                    nxt = self[i]
-                    if nxt != i:
-                        d[i] = nxt
+            s, o = self.a, other.a
+            if len(s) < len(o):
+                s = s+tuple(range(len(s), len(o)))
+            elif len(o) < len(s):
+                o = o+tuple(range(len(o), len(s)))
+            p = Permutation.from_images(tuple(map(s.__getitem__, o)))
+            p._factors = (self, other)
             if self.name and other.name:
-                return Permutation(d,self.name+'*'+other.name)
-            return Permutation(d)
+                p.name = self.name+'*'+other.name
+            return p
         elif other:
             return self
         else:
@@ -115,20 +184,87 @@ class Permutation:
     __rmul__ = __mul__
     __mod__ = __mul__
 
+    def identity(self):
+        return Permutation.from_images(())
+
+    def inverse(self):
+        a = [0]*len(self.a)
+        for i, j in enumerate(self.a):
+            a[j] = i
+        return Permutation.from_images(tuple(a))
+
+    def cycle_type(self):
+        return tuple(sorted((len(c) for c in self.cycles()), reverse=True))
+
+    def order(self):
+        # lcm of the cycle lengths
+        o = 1
+        for c in self.cycles():
+            o = o*len(c)//gcd(o, len(c))
+        return o
+
     def sign(self):
         # Return 1 for even, -1 for odd
-        if len(self.d) == 0:
-            return 1
-        checked = []
-        sign = 0
-        for i in self.d:
-            if i in checked:
-                continue
-            cur = i
-            cycle_length = 1
-            while cur not in checked:
-                checked.append(cur)
-                cur = self.d[cur]
-                cycle_length += 1
-            sign = (sign+cycle_length)%2
-        return -1 if sign else 1
+        return -1 if sum(len(c)-1 for c in self.cycles())%2 else 1
+
+class PermutationArray:
+    def __init__(self, perms, degree=None):
+        self.perms = list(perms)
+        self.n = degree if degree != None else max([p.degree() for p in self.perms]+[1])
+        self.a = numpy.tile(numpy.arange(self.n, dtype=numpy.intp), (len(self.perms), 1))
+        for i, p in enumerate(self.perms):
+            self.a[i, :len(p.a)] = p.a
+        self._init_index()
+
+    def _init_index(self):
+        if self.n**self.n < 2**63:
+            # Rows fit a mixed-radix int64 code, so lookups are vectorized
+            self.radix = self.n**numpy.arange(self.n, dtype=numpy.int64)
+            self.index = CodeIndex(self.codes(self.a), self.n**self.n)
+        else:
+            self.radix = None
+            self.lookup = {r.tobytes(): i for i, r in enumerate(self.a)}
+
+    def __getstate__(self):
+        # Only the images, in the smallest type holding them, go to other processes; the
+        # Permutation objects and index stay behind
+        return {'n': self.n, 'a': self.a.astype(numpy.min_scalar_type(self.n))}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.a = self.a.astype(numpy.intp)
+        self.perms = None
+        self._init_index()
+
+    def __len__(self):
+        return len(self.a)
+
+    def codes(self, rows):
+        return rows.astype(numpy.int64) @ self.radix
+
+    def find(self, rows):
+        # Index of each row among the permutations, -1 where absent
+        if self.radix is None:
+            return numpy.array([self.lookup.get(r.tobytes(), -1) for r in rows], dtype=numpy.int64)
+        return self.index.find(self.codes(rows))
+
+    def rows(self, start, stop, chunk=1<<22):
+        # Cayley table rows [start, stop), gathered a block of rows at a time
+        out = numpy.empty((stop-start, len(self.a)), dtype=numpy.int64)
+        step = max(1, chunk//max(1, len(self.a)*self.n))
+        for i in range(start, stop, step):
+            j = min(stop, i+step)
+            products = numpy.take_along_axis(self.a[i:j, None, :], self.a[None, :, :], axis=2)
+            out[i-start:j-start] = self.find(products.reshape(-1, self.n)).reshape(j-i, -1)
+        return out
+
+    def left(self, i, idx=slice(None)):
+        # Indices of perms[i]*perms[j] for j in idx
+        return self.find(self.a[i][self.a[idx]])
+
+    def right(self, i, idx=slice(None)):
+        # Indices of perms[j]*perms[i] for j in idx
+        return self.find(self.a[idx][:, self.a[i]])
+
+    def commuting(self, j):
+        return (self.a[:, self.a[j]] == self.a[j][self.a]).all(axis=1)
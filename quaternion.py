@@ -5,6 +5,7 @@ from math import sqrt
 class Quaternion:
     TOLERANCE = 0.0000001
     ROUND = 12
+    HASH_ROUND = 9
 
     @classmethod
     def q_normalize(cls, v):
@@ -30,6 +31,9 @@ class Quaternion:
             return Quaternion(*[0 if abs(n)<self.TOLERANCE else round(n,self.ROUND) for n in [n / mag for n in self.v]])
         return self
 
+    def identity(self):
+        return Quaternion(r=1)
+
     def conjugate(self):
         w, x, y, z = self.v
         return Quaternion(w, -x, -y, -z)
@@ -58,9 +62,16 @@ class Quaternion:
 
     __repr__ = __str__
 
+    def key(self):
+        # Components rounded coarser than ROUND, so float noise in products is absorbed; __eq__
+        # and __hash__ both compare this, so equal values always hash alike
+        if not hasattr(self, '_key'):
+            self._key = tuple(round(n, self.HASH_ROUND)+0.0 for n in self.v)
+        return self._key
+
     def __hash__(self):
         if not hasattr(self, '_hash'):
-            self._hash = hash(self.v)
+            self._hash = hash(self.key())
         return self._hash
 
     def __mul__(self, other):
@@ -87,14 +98,8 @@ class Quaternion:
         if other==None:
             return False
         if not isinstance(other, Quaternion):
-            return (abs(self.v[1])<self.TOLERANCE and
-                    abs(self.v[2])<self.TOLERANCE and
-                    abs(self.v[3])<self.TOLERANCE and
-                    abs(self.v[0]-other)<self.TOLERANCE)
-        return (abs(self.v[0]-other.v[0])<self.TOLERANCE and
-                abs(self.v[1]-other.v[1])<self.TOLERANCE and
-                abs(self.v[2]-other.v[2])<self.TOLERANCE and
-                abs(self.v[3]-other.v[3])<self.TOLERANCE )
+            return self.key() == (round(other, self.HASH_ROUND)+0.0, 0.0, 0.0, 0.0)
+        return self.key() == other.key()
 
     def __lt__(self, other):
         return hash(self) < hash(other)
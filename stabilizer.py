@@ -0,0 +1,128 @@
+import random
+
+from permutation import Permutation
+
+def _mul(s, o):
+    return tuple(map(s.__getitem__, o))
+
+def _inv(s):
+    a = [0]*len(s)
+    for i, j in enumerate(s):
+        a[j] = i
+    return tuple(a)
+
+class StabilizerChain:
+    def __init__(self, generators, degree=None):
+        self.n = degree if degree != None else max([g.degree() for g in generators]+[0])
+        self.e = tuple(range(self.n))
+        self.base = []
+        self.strong = []
+        self.orbits = []
+        for g in generators:
+            a = self.pad(g)
+            if a != self.e and a not in self.strong:
+                self.strong.append(a)
+        for a in self.strong:
+            if all(a[b] == b for b in self.base):
+                self.base.append(next(i for i in range(self.n) if a[i] != i))
+        self.orbits = [None]*len(self.base)
+        self._schreier_sims()
+
+    def pad(self, p):
+        return p.a+tuple(range(len(p.a), self.n))
+
+    def _level_generators(self, i):
+        return [s for s in self.strong if all(s[b] == b for b in self.base[:i])]
+
+    def _orbit(self, i):
+        # Transversal of base[i] under the generators fixing base[:i]: point -> (u, u^-1), u(base[i]) = point
+        gens = self._level_generators(i)
+        b = self.base[i]
+        orbit = {b: (self.e, self.e)}
+        queue = [b]
+        while queue:
+            p = queue.pop()
+            u = orbit[p][0]
+            for s in gens:
+                q = s[p]
+                if q not in orbit:
+                    v = _mul(s, u)
+                    orbit[q] = (v, _inv(v))
+                    queue.append(q)
+        self.orbits[i] = orbit
+        return gens
+
+    def sift(self, a, start=0):
+        # Strip a through the chain, returning the residue and the level it stopped at
+        for j in range(start, len(self.base)):
+            q = a[self.base[j]]
+            if q not in self.orbits[j]:
+                return a, j
+            a = _mul(self.orbits[j][q][1], a)
+        return a, len(self.base)
+
+    def _schreier_sims(self):
+        stale = set(range(len(self.base)))
+        i = len(self.base)-1
+        while i >= 0:
+            # Levels above i form a valid chain; check every Schreier generator of level i sifts through it
+            for k in sorted(stale):
+                if k >= i:
+                    self._orbit(k)
+                    stale.discard(k)
+            gens = self._level_generators(i)
+            orbit = self.orbits[i]
+            residue = None
+            for p in list(orbit):
+                u = orbit[p][0]
+                for s in gens:
+                    h, j = self.sift(_mul(orbit[s[p]][1], _mul(s, u)), i+1)
+                    if h != self.e:
+                        residue = (h, j)
+                        break
+                if residue:
+                    break
+            if residue == None:
+                i -= 1
+                continue
+            h, j = residue
+            self.strong.append(h)
+            if j == len(self.base):
+                self.base.append(next(k for k in range(self.n) if h[k] != k))
+                self.orbits.append(None)
+            stale.update(range(j+1))
+            i = j
+
+    def order(self):
+        o = 1
+        for orbit in self.orbits:
+            o *= len(orbit)
+        return o
+
+    def __len__(self):
+        return self.order()
+
+    def __contains__(self, p):
+        if not isinstance(p, Permutation) or p.degree() > self.n:
+            return False
+        h, j = self.sift(self.pad(p))
+        return h == self.e and j == len(self.base)
+
+    def random(self, rng=random):
+        a = self.e
+        for orbit in reversed(self.orbits):
+            a = _mul(rng.choice(list(orbit.values()))[0], a)
+        return Permutation.from_images(a)
+
+    def __iter__(self):
+        # Every element exactly once, as a product of one transversal element per level
+        def rec(i, a):
+            if i < 0:
+                yield Permutation.from_images(a)
+                return
+            for u, _ in self.orbits[i].values():
+                yield from rec(i-1, _mul(u, a))
+        if self.orbits:
+            yield from rec(len(self.orbits)-1, self.e)
+        else:
+            yield Permutation.from_images(self.e)
@@ -1,9 +1,20 @@
 import unittest
+import gc
+import numpy
+import os
+import pickle
+import tempfile
 from groups import *
 from operations import *
 from matrix import *
 from permutation import *
 from quaternion import *
+from groupcache import GroupCache
+from cayley import CayleyTable
+import cayley
+from instrument import Instrument, cache_stats
+from operations import evaluation_counts
+from output import WRITERS
 
 class GroupsTestCase(unittest.TestCase):
     def test_operations(self):
@@ -17,6 +28,33 @@ class GroupsTestCase(unittest.TestCase):
         self.assertEqual(getop('mult').name, 'mult')
         self.assertEqual(getop('mult', id='test_operations').name, 'x')
         self.assertEqual(getop('matrixmod', 7)(Matrix([[1,2],[3,4]]), Matrix([[1,2],[3,4]])), Matrix([[0,3],[1,1]]))
+        o = getop('addmod', 5, cache=3)
+        for x in [1, 2, 3, 1, 4, 1]:
+            o(x, 1)
+        self.assertEqual(o.cache_info()[:5], (2, 4, 3, 3, 1))
+        o = getop('matrixmod', 3, cache=1000, cache_bytes=2000)
+        g = GL(2, Z(3), o)
+        g.cayley()
+        self.assertLessEqual(o.cache_info().nbytes, 2000)
+        self.assertGreater(o.cache_info().evictions, 0)
+        g = GL(2, Z(3), getop('matrixmod', 3, cache=10000, keyed=1))
+        self.assertEqual(g.cayley(), GL(2, Z(3), getop('matrixmod', 3)).cayley())
+        self.assertEqual(g.op.key((g.l[1], g.l[2])), len(g)+2)
+        o = getop('addmod', 7, keyed=1)
+        a, b, c = 10, 20, 30
+        o.index([a, b, c, c])
+        self.assertNotEqual(o.key((a, c)), o.key((b, a)))
+        self.assertEqual([o(a, c), o(b, a), o(a, c)], [(a+c)%7, (b+a)%7, (a+c)%7])
+        self.assertEqual(getop('mult', id='shared') is getop('mult', id='shared'), True)
+        # The id registry holds its operations, so the cache outlives every group using it
+        o = getop('addmod', 5, id='test_operations_kept')
+        o(1, 2)
+        key = id(o)
+        del o
+        gc.collect()
+        self.assertEqual(id(getop('addmod', 5, id='test_operations_kept')), key)
+        self.assertEqual(getop('addmod', 5, id='test_operations_kept').cache_info().misses, 1)
+        self.assertEqual(pickle.loads(pickle.dumps(getop('addmod', 5, cache=3, keyed=1))).cache_info()[2], 3)
 
     def test_consistency(self):
         g = Z(3)
@@ -32,6 +70,69 @@ class GroupsTestCase(unittest.TestCase):
         self.assertEqual(a.orders()[Matrix([[3,3],[0,1]])], 2)
         self.assertEqual(a.orders()[Matrix([[2,1],[0,1]])], None)
 
+    def test_matrix(self):
+        x = Matrix([[1,2],[3,4]])
+        self.assertEqual(x, Matrix.from_flat((1,2,3,4), (2,2)))
+        self.assertEqual(hash(x), hash(Matrix(numpy.array([[1,2],[3,4]]))))
+        self.assertEqual(x*x, Matrix([[7,10],[15,22]]))
+        self.assertEqual(2*x+1, Matrix([[3,5],[7,9]]))
+        self.assertEqual(x == Matrix([[1,2,3,4]]), False)
+        self.assertEqual(Matrix([[1,2,3]]).shape, (1,3))
+        self.assertEqual(str(x), '[[1, 2], [3, 4]]')
+
+    def test_matrixkernels(self):
+        m = M(3, [-1, 2])
+        stack = numpy.array([x.array() for x in m])
+        self.assertEqual(det_bareiss(stack).tolist(), [x.det() for x in m])
+        self.assertEqual(det_mod(stack, 5).tolist(), [x.det()%5 for x in m])
+        # Past int64: the kernel must switch to exact integers rather than wrap
+        self.assertEqual(Matrix([[10**10,1],[1,10**10]]).det(), 10**20-1)
+        self.assertEqual(Matrix([[2**40,3],[5,2**40]]).det(), 2**80-15)
+        self.assertEqual(det_bareiss([[[10**30,1,0],[2,10**30,0],[0,0,3]]]).tolist(), [3*10**60-6])
+        self.assertEqual(mult_mod(stack[:2], stack[2], 7).tolist(), [(x*m.l[2]).array().__mod__(7).tolist() for x in m.l[:2]])
+        a = Aff(Z(7), getop('matrixmod', 7))
+        f = FiniteGroup(a.l, a.op)
+        self.assertEqual(a.table().table.tolist(), f.table().table.tolist())
+
+    def test_primefield(self):
+        for s, p in [(2, 3), (2, 5), (3, 2)]:
+            op = getop('matrixmod', p)
+            g = GL(s, Z(p), op)
+            sl = SL(s, Z(p), op)
+            m = M(s, Z(p), op)
+            self.assertEqual(len(g), g.count())
+            self.assertEqual(len(sl), sl.count())
+            self.assertEqual(set(g), set([x for x in m if x.det()%p!=0]))
+            self.assertEqual(set(sl), set([x for x in m if x.det()%p==1]))
+            self.assertEqual(g.e, M.one(s))
+            self.assertEqual(sl<=g, True)
+        self.assertEqual(len(GL(4, Z(3), getop('matrixmod', 3), lazy=1)), 24261120)
+        self.assertEqual(len(SL(3, Z(5), getop('matrixmod', 5), lazy=1)), 372000)
+        # Outside a prime field the count is enumerated, but only once len() asks for it
+        lazy = GL(2, Z(4), getop('matrixmod', 4), lazy=1)
+        self.assertEqual(hasattr(lazy, '_len') or lazy._l != None, False)
+        self.assertEqual(len(lazy), len(GL(2, Z(4), getop('matrixmod', 4)).l))
+        self.assertEqual(SL(2, Z(4), getop('matrixmod', 4), lazy=1).count(), len(SL(2, Z(4), getop('matrixmod', 4)).l))
+
+    def test_orders(self):
+        for g in [S(5), A(4), PermutationGeneratorGroup([[[1,2,3,4]],[[1,2]]]), GL(2, Z(3), getop('matrixmod', 3)),
+                  Dic(4), U(20), Zx(10), Z(12), Aff(Z(4), getop('matrixmod', 4)),
+                  PermutationGroup([[[1,2,3]], [[1,2]]]), PermutationGroup([[[1,2,3,4]], [[1,2]], []])]:
+            for x in g:
+                term, naive = x, None
+                for k in range(1, len(g)+1):
+                    if term == g.e:
+                        naive = k
+                        break
+                    term = g.op(term, x)
+                self.assertEqual(g.order(x), naive)
+                term = x
+                for k in range(1, 8):
+                    self.assertEqual(g.power(x, k), term)
+                    term = g.op(term, x)
+        # Not a group: (1 2 3) needs more powers than the set has elements
+        self.assertEqual(PermutationGroup([[[1,2,3]], [[1,2]]]).order(Permutation([[1,2,3]])), None)
+
     def test_comparisons(self):
         z = Z(3)
         m = M(2, z, getop('matrixelement', z.op, id='test_comparisons'))
@@ -66,6 +167,15 @@ class GroupsTestCase(unittest.TestCase):
             Permutation([5, 3])).sign(),1)
         self.assertEqual((Permutation([3, 5])*
             Permutation([5, 3])).sign(),1)
+        self.assertEqual(str(Permutation([[3, 1], [2, 5]])), '(3 1)(2 5)')
+        # Products print their right factor's points first, as the dict-backed original did
+        p = Permutation([[1, 2]])*Permutation([[3, 4]])
+        self.assertEqual(str(p), '(3 4)(1 2)')
+        self.assertEqual(str(pickle.loads(pickle.dumps(p*Permutation([[5, 1]])))), '(5 2 1)(3 4)')
+        self.assertEqual(format(Permutation([1, 2], 'f'), '#'), 'f')
+        self.assertEqual(hash(Permutation([])), hash(Permutation.from_images((0, 1, 2))))
+        self.assertEqual(Permutation([1, 3, 4])*Permutation([1, 3, 4]).inverse(), Permutation([]))
+        self.assertEqual(Permutation([1, 3, 4]).inverse(), Permutation([4, 3, 1]))
 
     def test_permutationgroup(self):
         self.assertEqual(D(4), PermutationGroup([
@@ -80,11 +190,30 @@ class GroupsTestCase(unittest.TestCase):
         self.assertEqual(D(4)<S(4), True)
         self.assertEqual(D(3), S(3))
 
+    def test_permutationarray(self):
+        g = S(4)
+        f = FiniteGroup(g.l, getop('mult'))
+        for h in [D(4), A(4), PermutationGroup([[]])]:
+            self.assertEqual(sorted(g.centralizer(h)), sorted(f.centralizer(h)))
+            self.assertEqual(sorted(map(sorted, g.lcosets(h))), sorted(map(sorted, f.lcosets(h))))
+            self.assertEqual(sorted(map(sorted, g.rcosets(h))), sorted(map(sorted, f.rcosets(h))))
+        self.assertEqual(g.cayley(), f.cayley())
+
     def test_generatorgroup(self):
         for i in range(5,20):
             self.assertEqual(Z(i),
                 GeneratorGroup(1 if i>1 else (0 if i==1 else None), getop('addmod', i)))
         self.assertEqual(PermutationGeneratorGroup([[[1,2,3]],[[1,2]]]), S(3))
+        self.assertEqual(GeneratorGroup([Permutation([1,2,3,4,5]), Permutation([1,2])], getop('mult')), S(5))
+        g = PermutationGeneratorGroup([[list(range(1,13))],[[1,2]]])
+        self.assertEqual(len(g), 479001600)
+        self.assertEqual(Permutation([[1,5],[2,7,11]]) in g, True)
+        self.assertEqual(Permutation([1,13]) in g, False)
+        self.assertEqual(g.random() in g, True)
+        g = PermutationGeneratorGroup([[[1,2,3]],[[2,3,4]]])
+        self.assertEqual(len(g), 12)
+        self.assertEqual(g, A(4))
+        self.assertEqual(Permutation([1,2]) in g, False)
 
     def test_permutationmatrix(self):
         self.assertEqual(Aff(D(2)), GeneratorGroup(Matrix([
@@ -94,14 +223,408 @@ class GroupsTestCase(unittest.TestCase):
             [Permutation([1,2]),Permutation([])],
             [0,1]]), Aff(D(2)).op))
 
+    def test_lazy(self):
+        s = S(10, lazy=1)
+        self.assertEqual(len(s), 3628800)
+        self.assertEqual(Permutation([1, 10, 4]) in s, True)
+        self.assertEqual(Permutation([1, 11]) in s, False)
+        self.assertEqual(next(iter(s)), Permutation([]))
+        self.assertEqual(s._l, None)
+        self.assertEqual(S(4, lazy=1), S(4))
+        self.assertEqual(len(A(6, lazy=1)), 360)
+        self.assertEqual(Permutation([1, 2]) in A(6, lazy=1), False)
+        m = M(3, Z(5), lazy=1)
+        self.assertEqual(len(m), 5**9)
+        self.assertEqual(Matrix([[1,2,3],[4,0,1],[2,2,2]]) in m, True)
+        self.assertEqual(Matrix([[1,2,3],[4,0,1],[2,2,5]]) in m, False)
+        self.assertEqual(m._l, None)
+        self.assertEqual(len(GL(2, Z(3), lazy=1)), len(GL(2, Z(3))))
+        self.assertEqual(set(SL(2, Z(3), lazy=1)), set(SL(2, Z(3))))
+
+    def test_table(self):
+        for group, h in [(lambda: S(4), D(4)), (lambda: D(6), D(2)), (lambda: Dic(3), GeneratorGroup(Dicyclic(3, 0, 1), getop('mult'))), (lambda: Aff(Z(5), getop('matrixmod', 5, id='test_table')), Aff(Z(5), getop('matrixmod', 5, id='test_table')))]:
+            g = group()
+            t = group()
+            t.table()
+            self.assertEqual(t.orders(), g.orders())
+            self.assertEqual(t.abelian(), g.abelian())
+            self.assertEqual(sorted(t.center()), sorted(g.center()))
+            self.assertEqual(sorted(t.centralizer(h)), sorted(g.centralizer(h)))
+            self.assertEqual(sorted(t.cyclic()[1]), sorted(g.cyclic()[1]))
+            self.assertEqual(t.cayley(), g.cayley())
+            self.assertEqual(sorted(map(sorted, t.lcosets(h))), sorted(map(sorted, g.lcosets(h))))
+            self.assertEqual(sorted(map(sorted, t.rcosets(h))), sorted(map(sorted, g.rcosets(h))))
+        a = Aff(Z(4), getop('matrixmod', 4))
+        a.table()
+        self.assertEqual(a.orders()[Matrix([[3,3],[0,1]])], 2)
+        self.assertEqual(a.orders()[Matrix([[2,1],[0,1]])], None)
+        for make in [lambda: MatrixGroup([[[1,0],[0,1]], [[1,1],[0,1]], [[1,0],[1,1]]], getop('mult')),
+                     lambda: FiniteGroup([Matrix([[1,0],[0,1]]), Matrix([[1,1],[0,1]]), Matrix([[1,0],[1,1]])], getop('mult'))]:
+            g, t = make(), make()
+            t.table()
+            self.assertEqual(t.table().closed(), False)
+            self.assertEqual(t.abelian(), g.abelian())
+            self.assertEqual(t.center(), g.center())
+            self.assertEqual(t.center(), [Matrix([[1,0],[0,1]])])
+            self.assertEqual(t.centralizer(t), g.centralizer(g))
+
+    def test_paralleltable(self):
+        for g in [S(4), GL(2, Z(3), getop('matrixmod', 3)), Dic(3)]:
+            h = pickle.loads(pickle.dumps(g))
+            self.assertEqual((h.table(jobs=3).table == g.table().table).all(), True)
+            self.assertEqual(h.table().blocks(cayley._closed_block), [True]*len(h.table().blocks(cayley._closed_block)))
+            self.assertEqual(h.orders(), g.orders())
+            self.assertEqual(h.center(), g.center())
+            self.assertEqual(h.abelian(), g.abelian())
+            self.assertEqual(h.centralizer(h.subset(h.mask(h.l[:2]))), g.centralizer(g.subset(g.mask(g.l[:2]))))
+        # Workers are sent the images alone, and write their rows into the file themselves
+        p = S(5).array()
+        self.assertEqual(pickle.loads(pickle.dumps(p.rows)).__self__.perms, None)
+        self.assertLess(len(pickle.dumps(p.rows)), len(pickle.dumps(p.perms)))
+        with tempfile.TemporaryDirectory() as d:
+            g = S(5)
+            g.save_table(os.path.join(d, 's5'), block=16, jobs=2)
+            h = S(5)
+            h.load_table(os.path.join(d, 's5'), jobs=2)
+            self.assertEqual((h.table().table == g.table().table).all(), True)
+            self.assertEqual(h.table().orders().tolist(), g.table().orders().tolist())
+
     def test_quaternion(self):
         self.assertEqual(Quaternion(0,1,0,0)*Quaternion(0,1,0,0),-1)
         self.assertEqual(Quaternion(0,0,1,0)*Quaternion(0,0,1,0),-1)
         self.assertEqual(Quaternion(0,0,0,1)*Quaternion(0,0,0,1),-1)
         self.assertEqual(Quaternion(0,1,0,0)*Quaternion(0,0,1,0)*Quaternion(0,0,0,1),-1)
+        for a, b in [(Quaternion(0.5000000005, 0.5, 0.5, 0.5), Quaternion(0.49999999949, 0.5, 0.5, 0.5)),
+                     (Quaternion(0.6, 0.8000000005), Quaternion(0.6, 0.79999999949)), (Quaternion(-0.0, 1), Quaternion(0, 1))]:
+            self.assertEqual(a == b, hash(a) == hash(b))
+            self.assertEqual(len({a, b}), 1 if a == b else 2)
         self.assertEqual(Q(8), Dic(2))
+        g = Dic(5)
+        for x in g:
+            for y in g:
+                self.assertEqual((x*y).quaternion(), x.quaternion()*y.quaternion())
+        self.assertEqual(g.table().closed(), True)
+        self.assertEqual(len(Dic(0)), 2)
+        self.assertEqual(Dicyclic(6, 5, 1)*Dicyclic(6, 5, 1).inverse(), Dicyclic(6))
         for i in range(1,20):
             self.assertEqual(len(Dic(i)), 4*i)
 
+    def test_classes(self):
+        for g, k in [(S(4), 5), (A(4), 4), (A(5), 5), (D(5), 4), (Dic(3), 6), (Z(6), 6)]:
+            self.assertEqual(len(g.conjugacy_classes()), k)
+            self.assertEqual(sum(g.class_sizes()), len(g))
+        self.assertEqual(S(4).class_equation(), '24 = 1 + 3 + 6 + 6 + 8')
+        self.assertEqual(A(5).class_sizes(), [1, 12, 12, 15, 20])
+        self.assertEqual(S(6).class_sizes(), sorted(len(c) for c in S(6).conjugacy_classes()))
+        g = PermutationGroup(A(5).l)
+        self.assertEqual(sorted(map(sorted, g.conjugacy_classes())), sorted(map(sorted, A(5).conjugacy_classes())))
+        g = GeneratorGroup([Permutation([1,2,3,4]), Permutation([1,2])], getop('mult'), 'S4')
+        self.assertEqual(sorted(map(sorted, g.conjugacy_classes())), sorted(map(sorted, S(4).conjugacy_classes())))
+        for g in [PermutationGroup(A(5).l), FiniteGroup(GL(2, Z(3), getop('matrixmod', 3)).l, getop('matrixmod', 3))]:
+            t = type(g)(g.l, op=g.op) if type(g) == FiniteGroup else PermutationGroup(g.l)
+            t.table()
+            self.assertEqual(sorted(map(sorted, g.conjugacy_classes())), sorted(map(sorted, t.conjugacy_classes())))
+            self.assertEqual(hasattr(g, '_table'), False)
+        m = M(2, Z(2), getop('matrixmod', 2))
+        self.assertEqual(sum(m.class_sizes()), len(m))
+        self.assertEqual(Permutation([[1,2,3],[4,5]]).cycle_type(), (3, 2))
+
+    def test_lattice(self):
+        for g, k in [(S(3), 6), (S(4), 30), (A(4), 10), (A(5), 59), (D(6), 16), (Dic(3), 8), (Z(12), 6)]:
+            subs, edges = g.subgroup_lattice()
+            self.assertEqual(len(subs), k)
+            self.assertEqual(subs[-1], g)
+            for h in subs[:-1]:
+                self.assertEqual(sorted(GeneratorGroup(h.generators, g.op).l), h.sorted())
+            for i, j in edges:
+                self.assertTrue(subs[i] < subs[j])
+                self.assertEqual(len(subs[j])%len(subs[i]), 0)
+        self.assertEqual([len(h) for h in S(4).subgroups(4)], [4]*7)
+        self.assertEqual(S(4).subgroups(5), [NullGroup()])
+        self.assertEqual(len(D(4).subgroup_lattice()[1]), 15)
+
+    def test_bitsets(self):
+        g = S(4)
+        self.assertTrue(D(4) < g)
+        self.assertFalse(g <= D(4))
+        self.assertEqual(g.mask(g.l), (1<<24)-1)
+        self.assertEqual(g.mask([Permutation([1,2,3,4,5])]), None)
+        subs = g.subgroup_lattice()[0]
+        for h in subs:
+            self.assertEqual(g.mask(h), g.mask(h.l))
+            self.assertEqual(h, GeneratorGroup(h.generators, g.op) if h is not g else g)
+        for i, j in g.subgroup_lattice()[1]:
+            self.assertTrue(subs[i] < subs[j])
+            self.assertFalse(subs[j] <= subs[i])
+        a = g.subset(g.mask(A(4)), 'A4')
+        self.assertEqual(a, A(4))
+        self.assertEqual(len(a), 12)
+        self.assertEqual(a.e, Permutation([]))
+        d, t = GeneratorGroup(D(4).l, getop('mult')), D(4)
+        t.table()
+        h = t.subgroups(4)[0]
+        self.assertEqual(sorted(map(sorted, d.lcosets(h))), sorted(map(sorted, t.lcosets(h))))
+        self.assertEqual(sorted(map(sorted, d.rcosets(h))), sorted(map(sorted, t.rcosets(h))))
+        z = Z(12)
+        h = FiniteGroup([0, 4, 8], z.op)
+        self.assertEqual(sorted(map(sorted, z.lcosets(h))), [[0, 4, 8], [1, 5, 9], [2, 6, 10], [3, 7, 11]])
+        self.assertEqual(sorted(map(sorted, z.rcosets(h))), [[0, 4, 8], [1, 5, 9], [2, 6, 10], [3, 7, 11]])
+
+    def test_quotient(self):
+        g = S(4)
+        self.assertEqual([len(h) for h in g.subgroup_lattice()[0] if g.is_normal(h)], [1, 4, 12, 24])
+        self.assertFalse(g.is_normal(D(4)))
+        self.assertEqual(g.quotient(D(4)), NullGroup())
+        self.assertEqual(sorted(g.coset_labels(A(4)).tolist()), [0]*12+[1]*12)
+        v = [h for h in g.subgroups(4) if g.is_normal(h)][0]
+        q = g.quotient(v)
+        self.assertEqual(len(q), 6)
+        self.assertFalse(q.abelian())
+        self.assertEqual(sorted(q.orders().values()), [1, 2, 2, 2, 3, 3])
+        self.assertEqual(q.table().closed(), True)
+        d = D(4)
+        q = d.quotient(d.subset(d.mask(d.center())))
+        self.assertEqual((len(q), q.abelian(), q.cyclic()[0]), (4, True, False))
+        z = Z(12)
+        q = z.quotient(FiniteGroup([0, 4, 8], z.op))
+        self.assertEqual(q.cyclic()[0], True)
+        self.assertEqual(q.op(q.l[1], q.l[3]), q.e)
+
+    def test_diskcache(self):
+        g = GL(2, Z(3), getop('matrixmod', 3))
+        g.table()
+        g.center()
+        h = pickle.loads(pickle.dumps(g))
+        self.assertEqual(h, g)
+        self.assertEqual(h.op, g.op)
+        self.assertEqual(h.center(), g.center())
+        self.assertEqual(h.power(h.l[1], 5), g.power(g.l[1], 5))
+        with tempfile.TemporaryDirectory() as d:
+            c = GroupCache(d)
+            key = c.key(GL, (2, Z(3), getop('matrixmod', 3)))
+            self.assertEqual(key, c.key(GL, (2, Z(3), getop('matrixmod', 3))))
+            self.assertNotEqual(key, c.key(GL, (2, Z(3), getop('matrixmod', 5))))
+            self.assertEqual(c.load(key, GL(2, Z(3), getop('matrixmod', 3))), None)
+            g.orders()
+            c.save(key, g)
+            self.assertEqual(sorted(os.listdir(d)), [key+'.json', key+'.npy'])
+            h = c.load(key, GL(2, Z(3), getop('matrixmod', 3)))
+            self.assertEqual(h, g)
+            self.assertEqual(h.table().table.tolist(), g.table().table.tolist())
+            self.assertEqual((h.orders(), h.center(), h.abelian()), (g.orders(), g.center(), g.abelian()))
+            # An entry for differently listed elements, or with indices out of range, is dropped
+            self.assertEqual(c.load(key, FiniteGroup(g.l[::-1], g.op, name=g.name)), None)
+            self.assertFalse(os.path.exists(c.path(key)))
+            c.save(key, g)
+            numpy.save(c.table_path(key), numpy.full((48, 48), 48, dtype=numpy.uint16))
+            self.assertEqual(c.load(key, GL(2, Z(3), getop('matrixmod', 3))), None)
+            self.assertEqual(os.listdir(d), [])
+            c.max_bytes = 1
+            c.save(key, g)
+            c.save(c.key(S, (3,)), S(3))
+            self.assertEqual(os.listdir(d), [os.path.basename(c.path(c.key(S, (3,))))])
+            # A lazy group only takes its length and scalar invariants
+            lazy = GL(2, Z(4), getop('matrixmod', 4), lazy=1)
+            lazy.abelian()
+            c.save('lazy', lazy)
+            h = c.load('lazy', GL(2, Z(4), getop('matrixmod', 4), lazy=1))
+            self.assertEqual((h._len, h._abelian, h._l), (len(lazy), False, None))
+
+    def test_codeindex(self):
+        from cayley import CodeIndex
+        p = PermutationArray([Permutation([]), Permutation([[1,2],[3,4],[5,6],[7,8]])])
+        self.assertEqual(hasattr(p.index, 'lut'), False)
+        self.assertEqual(p.find(p.a[::-1]).tolist(), [1, 0])
+        self.assertEqual(hasattr(S(5).array().index, 'lut'), True)
+        codes = numpy.array([5, 3, -1, 9], dtype=numpy.int64)
+        for size in [16, 1<<20]:
+            self.assertEqual(CodeIndex(codes, size).find(numpy.array([9, 4, 3, -1, 5])).tolist(), [3, -1, 1, -1, 0])
+
+    def test_tablefile(self):
+        with tempfile.TemporaryDirectory() as d:
+            g = S(5)
+            g.save_table(os.path.join(d, 'S5'), block=7)
+            h = S(5)
+            t = h.load_table(os.path.join(d, 'S5.npy'))
+            self.assertIsInstance(t.table, numpy.memmap)
+            self.assertEqual(t.table.dtype, numpy.uint16)
+            self.assertEqual((t.table == g.table().table).all(), True)
+            self.assertEqual(h.orders(), S(5).orders())
+            self.assertEqual(h.center(), [Permutation([])])
+            self.assertEqual(len(h.conjugacy_classes()), 7)
+            self.assertRaises(ValueError, D(5).load_table, os.path.join(d, 'S5'))
+            f = FiniteGroup([0, 1, 2, 3], getop('add'), 0)
+            f.table().save(os.path.join(d, 'f'))
+            t = CayleyTable.load(os.path.join(d, 'f'), 0)
+            self.assertEqual(t.missing, 65535)
+            self.assertEqual(t.closed(), False)
+            self.assertEqual(t.orders().tolist(), [1, 0, 0, 0])
+            self.assertEqual([len(c) for c in t.cosets(numpy.array([0]))], [1, 1, 1, 1])
+            self.assertEqual([f for f in os.listdir(d) if 'tmp' in f], [])
+            numpy.save(os.path.join(d, 'S5.npy'), numpy.zeros((3, 3), dtype=numpy.uint16))
+            self.assertRaises(ValueError, S(5).load_table, os.path.join(d, 'S5'))
+
+    def test_workers(self):
+        # Groups run concurrently print the same output, in the same order, as a serial run
+        import subprocess, sys
+        def run(*extra):
+            out = subprocess.run([sys.executable, 'groups.py', '-g', 'S', '3', '-g', 'Dic', '3', '-t', 'orders', 'center', 'classes']+list(extra),
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+            return [l for l in out.splitlines() if '_time' not in l]
+        serial = run()
+        self.assertIn('group: Dic(3) = ', '\n'.join(serial))
+        self.assertEqual(run('-w', '2'), serial)
+
+    def test_diskcache_hits(self):
+        # A hit is not written back unless the run added to it
+        import subprocess, sys
+        with tempfile.TemporaryDirectory() as d:
+            def run(*tasks):
+                subprocess.run([sys.executable, 'groups.py', '-g', 'S', '4', '--cache-dir', d, '-t']+list(tasks),
+                               cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, check=True)
+                return os.stat(os.path.join(d, [f for f in os.listdir(d) if f.endswith('.json')][0])).st_ino
+            first = run('orders')
+            self.assertEqual(run('orders'), first)
+            self.assertNotEqual(run('orders', 'center'), first)
+
+    def test_tabledir(self):
+        # Tables left partly written or without their elements are rebuilt, not reused
+        import subprocess, sys
+        with tempfile.TemporaryDirectory() as d:
+            run = lambda: subprocess.run([sys.executable, 'groups.py', '-g', 'S', '4', '--table-dir', d, '-t', 'center'],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+            run()
+            path = os.path.join(d, [f for f in os.listdir(d) if f.endswith('.npy')][0])
+            for damage in [lambda: open(path, 'wb').close(), lambda: os.remove(path[:-4]+'.elements'),
+                           lambda: numpy.save(path, numpy.zeros((24, 24), dtype=numpy.int64))]:
+                damage()
+                self.assertIn('center: [()]', run())
+                self.assertEqual(S(4).load_table(path).closed(), True)
+
+    def test_output(self):
+        import contextlib, csv, io, json
+        def run(fmt, *args):
+            out = io.StringIO()
+            g = D(4)
+            with contextlib.redirect_stdout(out):
+                WRITERS[fmt].start_run()
+                w = WRITERS[fmt](g, 0, *args)
+                w.value('center', g.center(), elements=True)
+                w.rows('lcosets', g.lcosets(g.subgroups(2)[0]))
+                w.table('cayley', g.l, g.table_rows, block=3)
+                w.end(task_time=0)
+                WRITERS[fmt].end_run(total_time=0)
+            return g, out.getvalue()
+        from output import Writer
+        self.assertRaises(TypeError, Writer, D(4))
+        g, out = run('json')
+        d = json.loads(out)['groups'][0]
+        self.assertEqual(d['center'], [str(x) for x in g.center()])
+        self.assertEqual(len(d['lcosets']), 4)
+        self.assertEqual(d['cayley']['rows'][3], [str(g.l[g.index()[g.op(g.l[3], x)]]) for x in g.l])
+        g, out = run('jsonl')
+        lines = [json.loads(l) for l in out.splitlines()]
+        self.assertEqual(len([l for l in lines if l.get('task') == 'cayley']), len(g))
+        self.assertEqual(lines[-1], {'total_time': 0})
+        g, out = run('csv')
+        rows = list(csv.reader(io.StringIO(out)))
+        self.assertEqual(rows[0], ['group', 'task', 'key', 'values'])
+        self.assertEqual([r[2:] for r in rows if r[1] == 'cayley'][2], [str(g.l[1])]+[str(g.l[g.index()[g.op(g.l[1], x)]]) for x in g.l])
+        with tempfile.TemporaryDirectory() as d:
+            g, out = run('npy', d)
+            files = {l['task']: l for l in map(json.loads, out.splitlines()) if 'file' in l}
+            t = CayleyTable.load(files['cayley']['file'], g.e)
+            self.assertEqual((t.table == g.table().table).all(), True)
+            with open(files['center']['elements'], 'rb') as f:
+                l = pickle.load(f)
+            self.assertEqual([l[i] for i in numpy.load(files['center']['file'])], g.center())
+            self.assertEqual(numpy.load(files['lcosets']['offsets']).tolist(), [0, 2, 4, 6, 8])
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                WRITERS['npy'](g, 1, d).rows('mixed', iter([[g.l[1]], ['x'], [g.l[2]]]))
+            self.assertEqual([json.loads(l)['value'] for l in out.getvalue().splitlines()], [[str(g.l[1])], ['x'], [str(g.l[2])]])
+            self.assertEqual([f for f in os.listdir(d) if f.endswith('.tmp')], [])
+
+    def test_output_tasks(self):
+        # Every default task through the CLI's npy writer
+        import json, subprocess, sys
+        with tempfile.TemporaryDirectory() as d:
+            for g in [['Z', '4'], ['S', '3']]:
+                out = subprocess.run([sys.executable, 'groups.py', '-g']+g+['--format', 'npy', '-o', d],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+                lines = [json.loads(l) for l in out.splitlines()]
+                tasks = {l['task'] for l in lines if 'task' in l}
+                self.assertEqual({'cyclic', 'orders', 'abelian', 'center', 'cayley', 'subgroups', 'cache'} <= tasks, True)
+                for l in lines:
+                    if 'file' in l:
+                        self.assertEqual(os.path.exists(l['file']), True)
+            self.assertEqual(numpy.load(os.path.join(d, '0-Z_4-cyclic_generators.npy')).tolist(), [1, 3])
+
+    def test_instrument(self):
+        with tempfile.TemporaryDirectory() as d:
+            inst = Instrument(True, os.path.join(d, 'prof'))
+            inst.start()
+            with inst.phase('construct'):
+                g = S(4)
+            n = g.op.evaluations
+            with inst.phase('center'):
+                g.center()
+            report = inst.stop(g, g.op.evaluations-n)
+            self.assertEqual([p['phase'] for p in report['phases']], ['construct', 'center'])
+            self.assertEqual(report['group'], 'S(4)')
+            self.assertGreater(report['op_evaluations'], 0)
+            self.assertGreater(report['peak_memory'], 0)
+            self.assertTrue(os.path.exists(os.path.join(d, 'prof')))
+        self.assertEqual('peak_memory' in Instrument().stop(), False)
+        op = getop('matrixmod', 3)
+        op(Matrix([[1,0],[0,1]]), Matrix([[1,0],[0,1]]))
+        counts = evaluation_counts()
+        g = MatrixGeneratorGroup([[[1,1],[0,1]],[[0,2],[1,0]]], op)
+        self.assertEqual(next(n for o, n in counts if o is op), 1)
+        self.assertGreater(g.op.evaluations, 1)
+        self.assertEqual(cache_stats('None'), None)
+        o = getop('addmod', 5, cache=8)
+        o(1, 2)
+        o(1, 2)
+        self.assertEqual(cache_stats(o.cache_info())['hit_rate'], 0.5)
+        self.assertEqual(o.evaluations, 1)
+
+    def test_bench(self):
+        import io
+        import bench_groups
+        results = bench_groups.run(['S', 'Dic'], 1, ['orders', 'lcosets'], 1, out=io.StringIO())
+        self.assertEqual(sorted(results), ['Dic/0/construct', 'Dic/0/lcosets', 'Dic/0/orders', 'S/0/construct', 'S/0/lcosets', 'S/0/orders'])
+        baseline = {'S/0/orders': 0.5, 'S/0/lcosets': 0.001, 'Z/0/orders': 0.1}
+        self.assertEqual(bench_groups.compare({'S/0/orders': 0.6, 'S/0/lcosets': 0.002, 'Z/0/orders': 0.9}, baseline, 0.25, 0.005), [('Z/0/orders', 0.1, 0.9)])
+
+    def test_identity(self):
+        l = GL(2, Z(3), getop('matrixmod', 3)).l
+        g = MatrixGroup(list(reversed(l)), getop('matrixmod', 3))
+        self.assertEqual(g.e, Matrix([[1,0],[0,1]]))
+        self.assertIs(g.e, g.l[g.index()[g.e]])
+        self.assertEqual(GeneratorGroup([Dicyclic(5,1,0), Dicyclic(5,0,1)], getop('mult')).e, Dicyclic(5))
+        self.assertEqual(GeneratorGroup(Quaternion(i=1), getop('mult')).e, Quaternion(r=1))
+        self.assertEqual(FiniteGroup([3, 0, 1, 2], getop('addmod', 4)).e, 0)
+        self.assertEqual(FiniteGroup([Matrix([[1,1],[0,1]]), Matrix([[0,0],[0,0]])], getop('matrixelement', getop('addmod', 2))).e, Matrix([[0,0],[0,0]]))
+        g = GeneratorGroup(Matrix([[0,1],[1,0]]), getop('matrixmod', 5))
+        self.assertEqual(g.power_cycle(g.generators[0]), Matrix([[1,0],[0,1]]))
+        self.assertEqual(FiniteGroup([Matrix([[1,0],[0,0]]), Matrix([[0,0],[0,1]])], getop('mult')).e, None)
+        self.assertEqual(FiniteGroup([2, 4], getop('multmod', 6)).e, 4)
+
+    def test_generating_set(self):
+        def brute(g):
+            return [x for x in g.l if all(g.op(x,y) == g.op(y,x) for y in g.l)]
+        for g in [D(6), Dic(4), S(4), GL(2, Z(3), getop('matrixmod', 3)), U(15),
+                  PermutationGeneratorGroup([[[1,2,3,4]],[[1,3]]]), GeneratorGroup([Dicyclic(3,1,0), Dicyclic(3,0,1)], getop('mult')),
+                  FiniteGroup(S(3).l, getop('mult'))]:
+            gens = g.generating_set()
+            self.assertNotEqual(gens, None)
+            self.assertEqual(len(GeneratorGroup(gens, g.op)), len(g))
+            self.assertEqual(g.center(), brute(g))
+            self.assertEqual(g.abelian(), len(brute(g)) == len(g))
+        g = FiniteGroup([1, 2, 3], getop('add'))
+        self.assertEqual(g.generating_set(), None)
+        self.assertEqual(g.center(), [1, 2, 3])
+
 if __name__ == '__main__':
     unittest.main()